@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, per-session round-robin wait queue.
+
+    At most `max_concurrent` holders run at once. Up to `max_queue` callers
+    wait for a slot, at most `max_queued_per_session` of them from the same
+    session, and freed slots go to sessions in turn so one chatty client
+    cannot starve the rest. Callers that would exceed a bound, or that wait
+    longer than `queue_timeout` seconds, get `Overloaded` immediately.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_queued_per_session: int,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queued_per_session = max_queued_per_session
+
+        self._active = 0
+        self._queued = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._service_time = 1.0
+
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.timed_out_total = 0
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "AdmissionController":
+        return cls(
+            max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "16")),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", "10")),
+            max_queued_per_session=int(
+                os.getenv(f"{prefix}_MAX_QUEUED_PER_SESSION", "4")
+            ),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self._active,
+            "queue_depth": self._queued,
+            "queued_sessions": len(self._queues),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "service_time_seconds": round(self._service_time, 3),
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "timed_out_total": self.timed_out_total,
+        }
+
+    def retry_after(self) -> int:
+        # Time for the current queue to drain at the observed service rate.
+        drain = self._service_time * (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(drain))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.rejected_total += 1
+        logger.warning(
+            "Request rejected by admission control",
+            extra={"reason": reason, **self.stats()},
+        )
+        return Overloaded(reason, self.retry_after())
+
+    async def acquire(self, session: str) -> None:
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            self.admitted_total += 1
+            return
+
+        if self._queued >= self.max_queue:
+            raise self._reject("queue full")
+
+        queue = self._queues.setdefault(session, deque())
+        if len(queue) >= self.max_queued_per_session:
+            raise self._reject("too many queued requests for session")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._queued += 1
+
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except TimeoutError:
+            # The slot may have been handed over just as the timeout fired.
+            if not (waiter.done() and not waiter.cancelled()):
+                self._dequeue(session, waiter)
+                self.timed_out_total += 1
+                raise self._reject("queue timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._dequeue(session, waiter)
+            raise
+
+        self.admitted_total += 1
+
+    def release(self) -> None:
+        while self._queues:
+            session, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+
+            if not waiter.done():
+                # Hand the slot straight to the waiter; `_active` is unchanged.
+                waiter.set_result(None)
+                return
+
+        self._active -= 1
+
+    def _dequeue(self, session: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(session)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[session]
+
+    @asynccontextmanager
+    async def slot(self, session: str):
+        await self.acquire(session)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+            self.release()
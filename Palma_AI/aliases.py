@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import docstore
+import providers
+from executors import run_ingest
+
+logger = logging.getLogger(__name__)
+
+# Logical namespaces (what clients send, usually the crawled URL) map to
+# physical versions ("<namespace>@v<n>") through one JSON file. A namespace
+# without an entry is its own physical namespace, so namespaces built before
+# aliases existed keep working. Full rebuilds write a fresh version and swap
+# the entry; the replaced version is retired and dropped once
+# ALIAS_GC_DELAY_SECONDS have passed, after in-flight reads are done. A
+# rebuild that fails retires the version it was writing instead.
+#
+# Writers replace the file atomically but do not lock it: run one rebuild
+# per namespace at a time. Multi-host deployments need it on shared storage.
+NAMESPACE_ALIASES = os.getenv("NAMESPACE_ALIASES", "namespace_aliases.json")
+ALIAS_CACHE_SECONDS = float(os.getenv("ALIAS_CACHE_SECONDS", "2"))
+ALIAS_GC_DELAY_SECONDS = float(os.getenv("ALIAS_GC_DELAY_SECONDS", "60"))
+
+_cache: Dict = {"checked": 0.0, "mtime": None, "aliases": {}}
+
+# Scheduled collections; keep the tasks referenced.
+_gc_tasks: set = set()
+
+
+def _read() -> Dict:
+    try:
+        return json.loads(Path(NAMESPACE_ALIASES).read_text())
+    except FileNotFoundError:
+        return {"aliases": {}, "retired": []}
+
+
+def _write(table: Dict) -> None:
+    path = Path(NAMESPACE_ALIASES)
+    staging = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    staging.write_text(json.dumps(table, indent=2))
+    os.replace(staging, path)
+    _cache["checked"] = 0.0
+
+
+def resolve(namespace: str) -> str:
+    """Physical namespace currently behind `namespace`.
+
+    The alias file is re-read at most every ALIAS_CACHE_SECONDS, and only
+    when it changed.
+    """
+    now = time.monotonic()
+    if now - _cache["checked"] >= ALIAS_CACHE_SECONDS:
+        _cache["checked"] = now
+        try:
+            mtime = os.stat(NAMESPACE_ALIASES).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != _cache["mtime"]:
+            _cache["aliases"] = _read()["aliases"] if mtime is not None else {}
+            _cache["mtime"] = mtime
+    return _cache["aliases"].get(namespace, namespace)
+
+
+def new_version(namespace: str) -> str:
+    return f"{namespace}@v{time.time_ns()}"
+
+
+def swap(namespace: str, physical: str) -> Optional[str]:
+    """Point `namespace` at `physical`; the previous version is retired."""
+    table = _read()
+    previous = table["aliases"].get(namespace, namespace)
+    table["aliases"][namespace] = physical
+    if previous != physical:
+        table["retired"].append([previous, time.time()])
+    _write(table)
+
+    logger.info(
+        "Namespace alias swapped",
+        extra={"namespace": namespace, "physical": physical, "previous": previous},
+    )
+    return previous if previous != physical else None
+
+
+def retire(physical: str) -> None:
+    """Queue `physical` for collection without an alias change, e.g. the
+    version a failed rebuild left half written."""
+    table = _read()
+    table["retired"].append([physical, time.time()])
+    _write(table)
+    logger.info("Namespace version retired", extra={"physical": physical})
+
+
+async def drop_version(physical: str) -> None:
+    await run_ingest(docstore.drop, physical)
+
+    async_index = await providers.get_async_pinecone_index()
+    if async_index is not None:
+        await async_index.delete(delete_all=True, namespace=physical)
+        return
+
+    drop = getattr(providers.get_vector_store(physical), "drop", None)
+    if drop is not None:
+        await run_ingest(drop)
+
+
+async def collect_garbage(delay: float = ALIAS_GC_DELAY_SECONDS) -> List[str]:
+    """Drop retired versions older than `delay` seconds; returns them."""
+    table = _read()
+    now = time.time()
+    live = set(table["aliases"].values())
+    due = [
+        physical
+        for physical, retired_at in table["retired"]
+        if now - retired_at >= delay and physical not in live
+    ]
+
+    dropped = []
+    for physical in due:
+        try:
+            await drop_version(physical)
+            dropped.append(physical)
+        except Exception:
+            logger.exception("Namespace version drop failed", extra={"physical": physical})
+
+    if dropped:
+        # Re-read: another swap may have happened while dropping.
+        table = _read()
+        table["retired"] = [r for r in table["retired"] if r[0] not in dropped]
+        _write(table)
+        logger.info("Namespace versions collected", extra={"dropped": dropped})
+    return dropped
+
+
+def schedule_collection(delay: float = ALIAS_GC_DELAY_SECONDS) -> None:
+    """Collect retired versions in the background once `delay` has passed.
+
+    A process that exits first leaves them for the next collection, or for
+    `python aliases.py gc`.
+    """
+
+    async def collect():
+        await asyncio.sleep(delay)
+        await collect_garbage(delay)
+
+    task = asyncio.create_task(collect())
+    _gc_tasks.add(task)
+    task.add_done_callback(_gc_tasks.discard)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect and maintain namespace aliases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show aliases and retired versions")
+    gc = sub.add_parser("gc", help="Drop retired versions")
+    gc.add_argument(
+        "--delay",
+        type=float,
+        default=ALIAS_GC_DELAY_SECONDS,
+        help="Only versions retired at least this many seconds ago",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = parse_args()
+    if args.command == "list":
+        print(json.dumps(_read(), indent=2))
+    else:
+        print(json.dumps(await collect_garbage(args.delay)))
+        await providers.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
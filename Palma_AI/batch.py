@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import providers
+from deadline import new_deadline
+from embedcache import EmbeddingCache
+from executors import run_ingest
+from query import assemble_context, expand, generate, rerank, retrieve
+
+logger = logging.getLogger(__name__)
+
+# Batch runs are for offline evaluation and cache warming. They skip the
+# checkpointer (no thread history is kept) and the chat admission queue, and
+# bound their own load instead: BATCH_SEARCH_CONCURRENCY vector searches and
+# BATCH_CONCURRENCY generations in flight per process, however many batches
+# run at once.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "32"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "5000"))
+
+search_slots = asyncio.Semaphore(max(1, BATCH_SEARCH_CONCURRENCY))
+generation_slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+# Questions to warm the caches with after every crawl, one per line.
+FAQ_FILE = os.getenv("FAQ_FILE")
+
+
+async def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed all queries in one batched call, skipping cached ones."""
+    embeddings = providers.get_embeddings()
+    if not isinstance(embeddings, EmbeddingCache):
+        return await embeddings.aembed_documents(queries)
+
+    vectors = [embeddings.lookup(q) for q in queries]
+    missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+    if missing:
+        embedded = dict(zip(missing, await embeddings.inner.aembed_documents(missing)))
+        for query, vector in embedded.items():
+            embeddings.remember(query, vector)
+        vectors = [v if v is not None else embedded[q] for q, v in zip(queries, vectors)]
+
+    logger.info(
+        "Batch queries embedded",
+        extra={"queries": len(queries), "embedded": len(missing)},
+    )
+    return vectors
+
+
+async def run_batch(
+    queries: List[str],
+    namespaces: List[str],
+    *,
+    embeddings: Optional[List[List[float]]] = None,
+    generate_answers: bool = True,
+    concurrency: int = BATCH_CONCURRENCY,
+    search_concurrency: int = BATCH_SEARCH_CONCURRENCY,
+) -> AsyncIterator[Dict]:
+    """Answer `queries` against `namespaces`, yielding results as they finish.
+
+    Each result carries the query's `index` in the input. With
+    `generate_answers` off only retrieval and reranking run, which is enough
+    to warm the embedding cache and the retrieval fallback. `concurrency`
+    and `search_concurrency` can only lower the process-wide bounds.
+    """
+    start = time.perf_counter()
+    if embeddings is None:
+        embeddings = await embed_queries(queries)
+
+    searches = asyncio.Semaphore(max(1, search_concurrency))
+    generations = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(index: int, query: str, embedding: List[float]) -> Dict:
+        started = time.perf_counter()
+        state = {
+            "query": query,
+            "namespace": ",".join(namespaces),
+            "namespaces": namespaces,
+            "query_embedding": embedding,
+            "messages": [],
+        }
+        try:
+            # Deadlines start when a stage does, not when the batch did.
+            async with searches, search_slots:
+                config = {"configurable": {"deadline": new_deadline()}}
+                state.update(await retrieve(state, config))
+                state.update(await rerank(state))
+
+            result = {"index": index, "query": query}
+            if generate_answers:
+                async with generations, generation_slots:
+                    config = {"configurable": {"deadline": new_deadline()}}
+                    state.update(await expand(state))
+                    state.update(await assemble_context(state))
+                    state.update(await generate(state, config))
+                result["answer"] = state["answer"]
+                result["sources"] = state["sources"]
+            else:
+                result["sources"] = [
+                    {
+                        "source": d.metadata.get("source", ""),
+                        "chunk_id": d.metadata.get("chunk_id", ""),
+                    }
+                    for d in state["retrieved_docs"]
+                ]
+            result["degraded"] = state.get("degraded") or None
+        except Exception as e:
+            logger.exception("Batch query failed", extra={"index": index})
+            result = {"index": index, "query": query, "error": str(e)}
+
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    tasks = [
+        asyncio.create_task(answer(i, q, e))
+        for i, (q, e) in enumerate(zip(queries, embeddings))
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    logger.info(
+        "Batch completed",
+        extra={
+            "queries": len(queries),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        },
+    )
+
+
+async def prewarm(queries: List[str], namespaces: List[str]) -> int:
+    """Warm the query-embedding cache and retrieval fallback for `queries`.
+
+    When the embedding cache has a snapshot directory the snapshot is
+    rewritten, so workers started afterwards begin warm.
+    """
+    warmed = 0
+    async for result in run_batch(queries, namespaces, generate_answers=False):
+        warmed += "error" not in result
+
+    embeddings = providers.get_embeddings()
+    if isinstance(embeddings, EmbeddingCache) and embeddings.directory:
+        await run_ingest(embeddings.save)
+
+    logger.info(
+        "Caches prewarmed",
+        extra={"queries": len(queries), "warmed": warmed, "namespaces": namespaces},
+    )
+    return warmed
+
+
+def read_queries(path: Path | str) -> List[str]:
+    """One query per line; JSON lines use their "query" field."""
+    queries = []
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if line.startswith("{"):
+            line = json.loads(line).get("query", "")
+        if line:
+            queries.append(line)
+    return queries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Answer a file of queries and write the results as JSON Lines",
+    )
+    parser.add_argument("queries", help="Text or JSONL file with one query per line")
+    parser.add_argument(
+        "--namespace",
+        action="append",
+        required=True,
+        help="Namespace to search (repeat for several)",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="Output JSONL file (default: stdout)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BATCH_CONCURRENCY,
+        help=f"Generations in flight (default and maximum: {BATCH_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--retrieve-only",
+        action="store_true",
+        help="Skip generation; report the selected sources only",
+    )
+    return parser.parse_args()
+
+
+async def main(args: Optional[argparse.Namespace] = None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = args or parse_args()
+    queries = read_queries(args.queries)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        async for result in run_batch(
+            queries,
+            args.namespace,
+            generate_answers=not args.retrieve_only,
+            concurrency=args.concurrency,
+        ):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,791 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+# cspell ignore ainvoke
+
+from fakes import LocalStack
+
+# Offline benchmarks for the ingestion pipeline and the /chat endpoint.
+# OpenAI, Pinecone and Tavily are replaced by the stand-ins in fakes.py, so
+# results depend only on this code and can be compared between commits:
+#
+#   uv run python benchmark.py pipeline --pages 50,200
+#   uv run python benchmark.py chat --concurrency 1,8,32 --llm-latency 0.2
+#   uv run python benchmark.py state --turns 10
+#   uv run python benchmark.py startup --budget-ms 1500
+#   uv run python benchmark.py memory --workers 1,2,4,8 --chunks 50000
+#   uv run python benchmark.py compare bench_results/a.json bench_results/b.json
+
+RESULTS_DIR = Path(__file__).parent / "bench_results"
+SITE_URL = "https://bench.local/"
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def save_results(name: str, params: Dict, results: List[Dict], output: str | None):
+    commit = git_commit()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    payload = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": stamp,
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+
+    path = Path(output) if output else RESULTS_DIR / f"{name}-{commit}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2))
+    print(f"Results written to {path}")
+    return path
+
+
+def install_stack(args, pages: int) -> LocalStack:
+    # /chat refuses to run without these, the stand-ins never read them.
+    for key in ("OPENAI_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX"):
+        os.environ.setdefault(key, "offline-benchmark")
+
+    return LocalStack(
+        pages=pages,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        seed=args.seed,
+    ).install()
+
+
+async def bench_pipeline(args) -> List[Dict]:
+    from injestion import run_pipeline
+
+    results = []
+    for pages in args.pages:
+        stack = install_stack(args, pages)
+        timings = []
+        for run in range(args.repeat):
+            stack.stores.clear()
+            start = time.perf_counter()
+            await run_pipeline(SITE_URL, max_depth=args.max_depth)
+            timings.append(time.perf_counter() - start)
+
+        chunks = len(stack.vector_store(SITE_URL).store)
+        best = min(timings)
+        results.append(
+            {
+                "pages": pages,
+                "chunks": chunks,
+                "runs": len(timings),
+                "best_seconds": round(best, 4),
+                "mean_seconds": round(statistics.fmean(timings), 4),
+                "pages_per_second": round(pages / best, 2),
+                "chunks_per_second": round(chunks / best, 2),
+            }
+        )
+        print(json.dumps(results[-1]))
+    return results
+
+
+QUESTIONS = [
+    "How do I export a report?",
+    "How can I restore a backup?",
+    "Where do I change my password?",
+    "How do webhook notifications work?",
+    "Can I give a user permission to edit a shelf?",
+    "How do I create an api token?",
+]
+
+
+def chat_query(i: int, unique: bool) -> str:
+    question = QUESTIONS[i % len(QUESTIONS)]
+    # A distinct text per request keeps concurrent first turns from being
+    # coalesced into one graph run.
+    return f"{question} (request {i})" if unique else question
+
+
+async def bench_chat(args) -> List[Dict]:
+    from injestion import run_pipeline
+
+    results = []
+    for pages in args.pages:
+        install_stack(args, pages)
+        await run_pipeline(SITE_URL, max_depth=args.max_depth)
+        results.extend(await bench_chat_site(args, pages))
+    return results
+
+
+async def bench_chat_site(args, pages: int) -> List[Dict]:
+    import httpx
+    from server import app
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        for concurrency in args.concurrency:
+            latencies: List[float] = []
+            errors = 0
+            queue: asyncio.Queue = asyncio.Queue()
+            for i in range(args.requests):
+                queue.put_nowait(i)
+
+            async def worker():
+                nonlocal errors
+                while True:
+                    try:
+                        i = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    body = {
+                        "query": chat_query(i, args.unique_queries),
+                        "namespace": SITE_URL,
+                    }
+                    if args.multi_turn:
+                        body["session_id"] = f"bench-{i % concurrency}"
+                    start = time.perf_counter()
+                    response = await client.post("/chat", json=body)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors += 1
+
+            async def coalesced_total() -> int:
+                return (await client.get("/metrics")).json()["coalesced_total"]
+
+            coalesced_before = await coalesced_total()
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            wall = time.perf_counter() - wall_start
+            coalesced = await coalesced_total() - coalesced_before
+
+            results.append(
+                {
+                    "pages": pages,
+                    "concurrency": concurrency,
+                    "errors": errors,
+                    "wall_seconds": round(wall, 4),
+                    "requests_per_second": round(len(latencies) / wall, 2),
+                    # Requests answered by joining another request's run.
+                    "coalesced_share": round(coalesced / max(len(latencies), 1), 4),
+                    **latency_summary(latencies),
+                }
+            )
+            print(json.dumps(results[-1]))
+
+    return results
+
+
+class CountingSerializer:
+    """Wraps a checkpoint serializer to count the bytes and time it spends."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.bytes = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    def dumps_typed(self, obj):
+        start = time.perf_counter()
+        typ, data = self.inner.dumps_typed(obj)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        self.calls += 1
+        return typ, data
+
+    def loads_typed(self, data):
+        return self.inner.loads_typed(data)
+
+
+async def bench_state(args) -> List[Dict]:
+    from injestion import run_pipeline
+
+    install_stack(args, args.pages[0])
+    await run_pipeline(SITE_URL, max_depth=args.max_depth)
+
+    from server import invoke_query
+    from query import get_query_app
+
+    query_app = get_query_app()
+
+    serde = CountingSerializer(query_app.checkpointer.serde)
+    query_app.checkpointer.serde = serde
+
+    results = []
+    for turn in range(1, args.turns + 1):
+        before_bytes, before_calls, before_seconds = serde.bytes, serde.calls, serde.seconds
+        await invoke_query(QUESTIONS[turn % len(QUESTIONS)], [SITE_URL], "bench-state")
+        results.append(
+            {
+                "turn": turn,
+                "checkpoint_bytes": serde.bytes - before_bytes,
+                "serialize_calls": serde.calls - before_calls,
+                "serialize_ms": round((serde.seconds - before_seconds) * 1000, 3),
+            }
+        )
+        print(json.dumps(results[-1]))
+
+    return results
+
+
+# Modules only the ingestion path needs; a chat worker must not import them.
+INGEST_ONLY_MODULES = ("injestion", "langchain_tavily", "langchain_text_splitters")
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+from query import get_query_app
+get_query_app()
+compiled = time.perf_counter()
+import langchain_openai, langchain_pinecone
+clients = time.perf_counter()
+print(json.dumps({
+    "import_server_ms": round((imported - start) * 1000, 1),
+    "compile_graph_ms": round((compiled - imported) * 1000, 1),
+    "client_libraries_ms": round((clients - compiled) * 1000, 1),
+    "ingest_modules_loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def run_probe(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    )
+
+
+def bench_startup(args) -> List[Dict]:
+    # Fresh interpreters, so every run pays the full import cost. The first
+    # run also warms the bytecode cache and is discarded.
+    probe = STARTUP_PROBE % (INGEST_ONLY_MODULES,)
+    run_probe(probe)
+    runs = [json.loads(run_probe(probe).stdout) for _ in range(args.repeat)]
+
+    profile = run_probe("import server", "-X", "importtime").stderr
+    modules = []
+    for line in profile.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            modules.append((int(parts[1]), name.strip()))
+    modules.sort(reverse=True)
+
+    result = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in ("import_server_ms", "compile_graph_ms", "client_libraries_ms")
+    }
+    result["ingest_modules_loaded"] = runs[-1]["ingest_modules_loaded"]
+    result["top_imports_ms"] = {
+        name: round(us / 1000, 1) for us, name in modules[: args.top]
+    }
+    print(json.dumps(result, indent=2))
+
+    if result["ingest_modules_loaded"]:
+        raise SystemExit(
+            "Ingestion-only modules imported by server: "
+            + ", ".join(result["ingest_modules_loaded"])
+        )
+    if args.budget_ms and result["import_server_ms"] > args.budget_ms:
+        raise SystemExit(
+            f"Import time {result['import_server_ms']}ms exceeds budget {args.budget_ms}ms"
+        )
+
+    return [result]
+
+
+def smaps_rollup(pid: int) -> Dict[str, float]:
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "uss_mb": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def memory_worker(path, mmap, searches, ready, done):
+    import numpy as np
+    from localindex import LocalIndex
+
+    index = LocalIndex(path, mmap=mmap)
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(searches):
+        index.search(rng.standard_normal(index.vectors.shape[1]), 6)
+        index.lexical_search("chunk topic", 6)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def bench_memory(args) -> List[Dict]:
+    # Simulates a preloaded gunicorn master forking N workers that all serve
+    # from the same local index, and reports what each worker really costs.
+    import multiprocessing
+    import tempfile
+
+    import numpy as np
+    from localindex import write_index
+
+    if not Path("/proc/self/smaps_rollup").exists():
+        raise SystemExit("The memory benchmark needs Linux /proc/<pid>/smaps_rollup")
+
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(args.seed)
+        vectors = rng.standard_normal((args.chunks, args.dims), dtype=np.float32)
+        path = write_index(
+            Path(tmp),
+            "bench",
+            [f"id-{i}" for i in range(args.chunks)],
+            [f"chunk {i} topic {i % 97}" for i in range(args.chunks)],
+            [{"source": f"page-{i // 8}"} for i in range(args.chunks)],
+            vectors,
+        )
+        del vectors
+        index_mb = sum(f.stat().st_size for f in path.iterdir()) / 2**20
+
+        for mode in args.modes:
+            for workers in args.workers:
+                ready, done = ctx.Queue(), ctx.Event()
+                procs = [
+                    ctx.Process(
+                        target=memory_worker,
+                        args=(path, mode == "mmap", args.searches, ready, done),
+                    )
+                    for _ in range(workers)
+                ]
+                for p in procs:
+                    p.start()
+                pids = [ready.get() for _ in procs]
+                samples = [smaps_rollup(pid) for pid in pids]
+                done.set()
+                for p in procs:
+                    p.join()
+
+                results.append(
+                    {
+                        "mode": mode,
+                        "workers": workers,
+                        "index_mb": round(index_mb, 1),
+                        "pss_mb_per_worker": round(
+                            statistics.fmean(s["pss_mb"] for s in samples), 1
+                        ),
+                        "uss_mb_per_worker": round(
+                            statistics.fmean(s["uss_mb"] for s in samples), 1
+                        ),
+                        "rss_mb_per_worker": round(
+                            statistics.fmean(s["rss_mb"] for s in samples), 1
+                        ),
+                        "pss_mb_total": round(sum(s["pss_mb"] for s in samples), 1),
+                    }
+                )
+                print(json.dumps(results[-1]))
+
+    return results
+
+
+def bench_snapshot(args) -> List[Dict]:
+    # Export a synthetic local namespace and restore it into a second local
+    # root, once per vector dtype. No embedding model is involved.
+    import tempfile
+
+    import numpy as np
+    import providers
+    import snapshot
+    from localindex import write_index, namespace_slug
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(args.seed)
+        source = Path(tmp) / "source"
+        write_index(
+            source / namespace_slug("bench"),
+            "bench",
+            [
+                f"https://bench.local/page-{i // 8}::chunk-{i % 8}"
+                for i in range(args.chunks)
+            ],
+            [f"chunk {i} topic {i % 97} " * 40 for i in range(args.chunks)],
+            [
+                {"source": f"https://bench.local/page-{i // 8}", "checksum": f"{i:064x}"}
+                for i in range(args.chunks)
+            ],
+            rng.standard_normal((args.chunks, args.dims), dtype=np.float32),
+        )
+
+        providers.VECTOR_BACKEND = "local"
+        for dtype in args.dtypes:
+            providers.LOCAL_INDEX_DIR = str(source)
+            start = time.perf_counter()
+            path = snapshot.export_namespace(
+                "bench", Path(tmp) / f"snapshot-{dtype}", dtype=dtype
+            )
+            export_seconds = time.perf_counter() - start
+
+            providers.LOCAL_INDEX_DIR = str(Path(tmp) / f"restored-{dtype}")
+            start = time.perf_counter()
+            snapshot.import_snapshot(path)
+            import_seconds = time.perf_counter() - start
+
+            results.append(
+                {
+                    "dtype": dtype,
+                    "chunks": args.chunks,
+                    "snapshot_mb": round(
+                        sum(f.stat().st_size for f in path.iterdir()) / 2**20, 1
+                    ),
+                    "export_seconds": round(export_seconds, 3),
+                    "import_seconds": round(import_seconds, 3),
+                    "import_chunks_per_second": round(args.chunks / import_seconds, 1),
+                }
+            )
+            print(json.dumps(results[-1]))
+
+    return results
+
+
+def bench_quantization(args) -> List[Dict]:
+    # Recall@k against exact float32 search, per-query latency and search
+    # matrix size for each storage option of the local index. Queries are
+    # corpus vectors with added noise, so a snapshot of a real namespace
+    # (--snapshot) gives figures for that corpus without embedding calls.
+    import tempfile
+
+    import numpy as np
+    from localindex import LocalIndex, normalise, write_index
+
+    rng = np.random.default_rng(args.seed)
+    if args.snapshot:
+        import snapshot
+
+        corpus = snapshot.Snapshot(args.snapshot, verify=False)
+        vectors = normalise(corpus.vectors(0, len(corpus)))
+    else:
+        # Clustered vectors whose variance falls off with the dimension
+        # index, roughly how Matryoshka-trained embeddings spread information.
+        decay = 1 / np.sqrt(1 + np.arange(args.dims) / 64)
+        centers = rng.standard_normal((max(args.chunks // 50, 1), args.dims))
+        assignment = rng.integers(len(centers), size=args.chunks)
+        noise = rng.standard_normal((args.chunks, args.dims))
+        vectors = normalise(((centers[assignment] + 0.5 * noise) * decay).astype(np.float32))
+
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = normalise(
+        vectors[picks] + args.query_noise * rng.standard_normal(vectors[picks].shape)
+        / np.sqrt(vectors.shape[1])
+    ).astype(np.float32)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, : args.k]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for config in args.configs:
+            dtype, _, dims = config.partition(":")
+            try:
+                path = write_index(
+                    Path(tmp) / config.replace(":", "-"),
+                    "bench",
+                    [str(i) for i in range(len(vectors))],
+                    [""] * len(vectors),
+                    [{}] * len(vectors),
+                    vectors,
+                    dtype=dtype,
+                    search_dims=int(dims or 0),
+                    keep_full=True,
+                )
+            except ValueError as e:
+                print(f"Skipping {config}: {e}")
+                continue
+            index = LocalIndex(path)
+            matrix = path / ("search.npy" if index.search_vectors is not None else "vectors.npy")
+
+            for rescore in args.rescore if index.search_vectors is not None else [0]:
+                index.rescore = rescore
+                for q in queries[:10]:
+                    index.search(q, args.k)
+
+                samples, hits = [], 0
+                for q, truth in zip(queries, exact):
+                    start = time.perf_counter()
+                    found = index.search(q, args.k)
+                    samples.append(time.perf_counter() - start)
+                    hits += len({row for row, _ in found} & set(truth.tolist()))
+
+                results.append(
+                    {
+                        "config": f"{config}/rescore={rescore}",
+                        "chunks": len(vectors),
+                        "search_mb": round(matrix.stat().st_size / 2**20, 1),
+                        f"recall_at_{args.k}": round(hits / (len(queries) * args.k), 4),
+                        **latency_summary(samples),
+                    }
+                )
+                print(json.dumps(results[-1]))
+
+    return results
+
+
+def compare(args) -> None:
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    if before["benchmark"] != after["benchmark"]:
+        raise SystemExit("Cannot compare results of different benchmarks")
+
+    keys = {
+        "chat": ("pages", "concurrency"),
+        "state": ("turn",),
+        "startup": (),
+        "memory": ("workers",),
+        "snapshot": ("dtype",),
+        "quantization": ("config",),
+    }.get(before["benchmark"], ("pages",))
+
+    def row_key(result: Dict, row: Dict) -> tuple:
+        # Chat results predating per-size rows ran the first --pages size.
+        first_pages = (result["params"].get("pages") or [None])[0]
+        defaults = {"pages": first_pages}
+        return tuple(row.get(k, defaults.get(k)) for k in keys)
+
+    print(f"{before['benchmark']}: {before['commit']} -> {after['commit']}")
+    after_rows = {row_key(after, row): row for row in after["results"]}
+    for row in before["results"]:
+        key = row_key(before, row)
+        other = after_rows.get(key)
+        if other is None:
+            continue
+        label = " ".join(f"{k}={v}" for k, v in zip(keys, key))
+        for metric, value in row.items():
+            if metric in keys or not isinstance(value, (int, float)) or not value:
+                continue
+            if not isinstance(other.get(metric), (int, float)):
+                continue
+            change = (other[metric] - value) / value * 100
+            print(
+                f"  {label:<20} {metric:<20} "
+                f"{value:>12} -> {other[metric]:>12} ({change:+.1f}%)"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks with local stand-ins for external services",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument(
+            "--pages",
+            type=int_list,
+            default=[50],
+            help="Synthetic site size(s), comma separated (default: 50)",
+        )
+        p.add_argument("--max-depth", type=int, default=5)
+        p.add_argument(
+            "--llm-latency",
+            type=float,
+            default=0.2,
+            help="Scripted chat model latency in seconds (default: 0.2)",
+        )
+        p.add_argument("--llm-jitter", type=float, default=0.0)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--output", help="Result file (default: bench_results/...)")
+        p.add_argument("--log-level", default="WARNING")
+
+    pipeline = sub.add_parser("pipeline", help="run_pipeline throughput")
+    common(pipeline)
+    pipeline.add_argument("--repeat", type=int, default=3)
+
+    chat = sub.add_parser("chat", help="/chat latency percentiles")
+    common(chat)
+    chat.add_argument(
+        "--concurrency",
+        type=int_list,
+        default=[1, 8, 32],
+        help="Concurrent clients, comma separated (default: 1,8,32)",
+    )
+    chat.add_argument("--requests", type=int, default=200)
+    chat.add_argument(
+        "--unique-queries",
+        action="store_true",
+        help="Give every request its own question text, so none are coalesced",
+    )
+    chat.add_argument(
+        "--multi-turn",
+        action="store_true",
+        help="Reuse one session per client instead of a new session per request",
+    )
+
+    state = sub.add_parser("state", help="Checkpoint bytes and CPU per chat turn")
+    common(state)
+    state.add_argument("--turns", type=int, default=10)
+
+    startup = sub.add_parser("startup", help="server.py cold start profile")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--top", type=int, default=15)
+    startup.add_argument(
+        "--budget-ms",
+        type=float,
+        default=0,
+        help="Fail when importing server.py takes longer (default: no budget)",
+    )
+    startup.add_argument("--output", help="Result file (default: bench_results/...)")
+
+    memory = sub.add_parser(
+        "memory", help="Per-worker memory with a shared local index"
+    )
+    memory.add_argument(
+        "--workers",
+        type=int_list,
+        default=[1, 2, 4, 8],
+        help="Worker counts, comma separated (default: 1,2,4,8)",
+    )
+    memory.add_argument("--chunks", type=int, default=50_000)
+    memory.add_argument("--dims", type=int, default=1536)
+    memory.add_argument("--searches", type=int, default=20)
+    memory.add_argument(
+        "--modes",
+        type=lambda v: v.split(","),
+        default=["mmap", "copy"],
+        help="mmap (shared) and/or copy (each worker loads its own arrays)",
+    )
+    memory.add_argument("--seed", type=int, default=0)
+    memory.add_argument("--output", help="Result file (default: bench_results/...)")
+
+    snap = sub.add_parser(
+        "snapshot", help="Namespace snapshot export and restore throughput"
+    )
+    snap.add_argument("--chunks", type=int, default=20_000)
+    snap.add_argument("--dims", type=int, default=1536)
+    snap.add_argument(
+        "--dtypes",
+        type=lambda v: v.split(","),
+        default=["float16", "float32"],
+        help="Snapshot vector dtypes, comma separated (default: float16,float32)",
+    )
+    snap.add_argument("--seed", type=int, default=0)
+    snap.add_argument("--output", help="Result file (default: bench_results/...)")
+
+    quant = sub.add_parser(
+        "quantization", help="Recall vs latency of local index storage options"
+    )
+    quant.add_argument(
+        "--configs",
+        type=lambda v: v.split(","),
+        default=["float32", "float32:256", "int8:256", "int8:512"],
+        help="dtype[:search_dims] entries, comma separated",
+    )
+    quant.add_argument(
+        "--rescore",
+        type=int_list,
+        default=[0, 4],
+        help="Rescore factors to try for compact configs (default: 0,4)",
+    )
+    quant.add_argument(
+        "--snapshot", help="Snapshot directory of a real namespace (snapshot.py)"
+    )
+    quant.add_argument("--chunks", type=int, default=100_000)
+    quant.add_argument("--dims", type=int, default=1536)
+    quant.add_argument("--queries", type=int, default=200)
+    quant.add_argument("--query-noise", type=float, default=0.5)
+    quant.add_argument("--k", type=int, default=10)
+    quant.add_argument("--seed", type=int, default=0)
+    quant.add_argument("--output", help="Result file (default: bench_results/...)")
+
+    cmp = sub.add_parser("compare", help="Compare two result files")
+    cmp.add_argument("before")
+    cmp.add_argument("after")
+
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+
+    if args.command == "compare":
+        compare(args)
+        return
+
+    if args.command in ("startup", "memory", "snapshot", "quantization"):
+        bench = {
+            "startup": bench_startup,
+            "memory": bench_memory,
+            "snapshot": bench_snapshot,
+            "quantization": bench_quantization,
+        }[args.command]
+        results = bench(args)
+        params = {k: v for k, v in vars(args).items() if k not in ("output", "command")}
+        save_results(args.command, params, results, args.output)
+        return
+
+    # The application modules call basicConfig at INFO; per-request log lines
+    # would dominate the measurements.
+    logging.basicConfig()
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.command == "pipeline":
+        results = await bench_pipeline(args)
+    elif args.command == "state":
+        results = await bench_state(args)
+    else:
+        results = await bench_chat(args)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "command")}
+    save_results(args.command, params, results, args.output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
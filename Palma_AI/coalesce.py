@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one execution between concurrent callers using the same key.
+
+    The work runs in its own task, detached from the request that started
+    it. Each caller awaits it through `asyncio.shield`, so a disconnecting
+    caller (including the one that started the flight) only stops waiting.
+    The work is cancelled once every caller has gone away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        # Callers served by a flight someone else started, since start-up.
+        self.joined = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """Return `(result, shared)`; `shared` is True for callers that joined
+        a flight started by someone else."""
+
+        flight = self._flights.get(key)
+        shared = flight is not None
+
+        if flight is None:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.joined += 1
+            logger.info("Joined in-flight request", extra={"waiters": flight.waiters + 1})
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                logger.info("All waiters gone, cancelling in-flight request")
+                # Forget first so a caller arriving now starts a fresh flight
+                # instead of joining one that is being cancelled.
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,39 @@
+import os
+import time
+from typing import Mapping, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+# End-to-end budget for one /chat request, measured from arrival (so time
+# spent in the admission queue counts), and per-stage caps within it.
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+
+STAGE_BUDGETS = {
+    "embed": float(os.getenv("EMBED_TIMEOUT_SECONDS", "5")),
+    "search": float(os.getenv("SEARCH_TIMEOUT_SECONDS", "5")),
+    # Each namespace of a multi-namespace query; a shard that misses it is
+    # left out of the merge instead of holding up the others.
+    "shard": float(os.getenv("SHARD_TIMEOUT_SECONDS", "2")),
+    "generate": float(os.getenv("GENERATE_TIMEOUT_SECONDS", "20")),
+}
+
+
+def new_deadline(seconds: Optional[float] = None) -> float:
+    return time.time() + (seconds if seconds is not None else CHAT_DEADLINE_SECONDS)
+
+
+def get_deadline(state: Mapping, config: Optional[RunnableConfig]) -> Optional[float]:
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("deadline") or state.get("deadline")
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
+
+
+def stage_timeout(stage: str, deadline: Optional[float]) -> float:
+    budget = STAGE_BUDGETS[stage]
+    left = remaining(deadline)
+    return budget if left is None else min(budget, left)
@@ -0,0 +1,347 @@
+import bisect
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from localindex import (
+    REOPEN_CHECK_SECONDS,
+    MappedStrings,
+    namespace_slug,
+    publish_version,
+    write_strings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Page-level parent documents for small-to-big retrieval. Chunks are matched
+# in the vector store; the chunks picked for the context are then widened to
+# their section or page from this store, on local disk, with no extra vector
+# store round trip.
+#
+# Layout of one physical namespace, versioned like localindex.py:
+#
+#   <root>/<slug>/CURRENT
+#   <root>/<slug>/<version>/
+#       manifest.json
+#       sources.bin, sources.offsets.npy   page URLs, sorted
+#       pages.bin, pages.offsets.npy       page texts, same order
+#       sections.indptr.npy, sections.npy  character offsets of each page's
+#                                          section starts (CSR by page)
+#
+# Chunks find their place in the page through the splitter's `start_index`,
+# checked against the page text, so chunks written before offsets were
+# recorded (or left unchanged by a delta) are located by search instead.
+DOCSTORE_DIR = os.getenv("DOCSTORE_DIR", "docstore")
+
+# A chunk grows to at most PARENT_SPAN_CHARS of its page, and all of them
+# together stay within CONTEXT_MAX_CHARS. 0 disables the expansion.
+PARENT_SPAN_CHARS = int(os.getenv("PARENT_SPAN_CHARS", "2000"))
+
+# Markdown headings start a section.
+SECTION_START = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+# One store per physical namespace, reopened when a new version lands.
+_stores: Dict[str, "ParentStore"] = {}
+
+
+def section_starts(text: str) -> List[int]:
+    starts = [m.start() for m in SECTION_START.finditer(text)]
+    return starts if starts and starts[0] == 0 else [0, *starts]
+
+
+def write_pages(directory: Path, namespace: str, pages: Dict[str, str]) -> Path:
+    """Write `pages` (source -> text) as a new version and make it live."""
+    directory.mkdir(parents=True, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    staging = directory / f".{version}.tmp"
+    staging.mkdir()
+
+    sources = sorted(pages)
+    write_strings(staging, "sources", sources)
+    write_strings(staging, "pages", (pages[s] for s in sources))
+
+    sections = [section_starts(pages[s]) for s in sources]
+    indptr = np.cumsum([0, *(len(s) for s in sections)], dtype=np.int64)
+    np.save(staging / "sections.indptr.npy", indptr)
+    np.save(
+        staging / "sections.npy",
+        np.asarray([o for s in sections for o in s], dtype=np.int64),
+    )
+
+    manifest = {
+        "namespace": namespace,
+        "version": version,
+        "pages": len(sources),
+        "created": time.time(),
+    }
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    publish_version(directory, staging, version)
+    logger.info(
+        "Parent documents written",
+        extra={"namespace": namespace, "version": version, "pages": len(sources)},
+    )
+    return directory / version
+
+
+class ParentPages:
+    """One immutable version of a namespace's pages, opened read-only."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.sources = MappedStrings(path, "sources")
+        self.pages = MappedStrings(path, "pages")
+        self.section_indptr = np.load(path / "sections.indptr.npy", mmap_mode="r")
+        self.sections = np.load(path / "sections.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def row(self, source: str) -> Optional[int]:
+        i = bisect.bisect_left(self.sources, source)
+        if i < len(self) and self.sources[i] == source:
+            return i
+        return None
+
+    def page(self, source: str) -> Optional[Tuple[str, np.ndarray]]:
+        row = self.row(source)
+        if row is None:
+            return None
+        start, end = self.section_indptr[row], self.section_indptr[row + 1]
+        return self.pages[row], self.sections[start:end]
+
+    def items(self) -> Iterable[Tuple[str, str]]:
+        for row in range(len(self)):
+            yield self.sources[row], self.pages[row]
+
+
+class ParentStore:
+    def __init__(self, root: Path | str, namespace: str):
+        self.namespace = namespace
+        self.directory = Path(root) / namespace_slug(namespace)
+        self._pages: Optional[ParentPages] = None
+        self._version: Optional[str] = None
+        self._checked = 0.0
+
+    @property
+    def pages(self) -> Optional[ParentPages]:
+        now = time.monotonic()
+        if now - self._checked < REOPEN_CHECK_SECONDS:
+            return self._pages
+        self._checked = now
+
+        try:
+            version = (self.directory / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            self._pages = self._version = None
+            return None
+
+        if version != self._version:
+            self._pages = ParentPages(self.directory / version)
+            self._version = version
+        return self._pages
+
+    def page(self, source: str) -> Optional[Tuple[str, np.ndarray]]:
+        pages = self.pages
+        return pages.page(source) if pages is not None else None
+
+    def write(
+        self, pages: Dict[str, str], *, replace: bool, removed: Iterable[str] = ()
+    ) -> None:
+        """Publish `pages`; unless `replace`, pages not among them are kept,
+        other than the `removed` ones."""
+        current = self.pages
+        if not replace and current is not None:
+            pages = {**dict(current.items()), **pages}
+            for source in removed:
+                pages.pop(source, None)
+        write_pages(self.directory, self.namespace, pages)
+        self._checked = 0.0
+
+    def drop(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._pages = self._version = None
+
+
+def get_store(namespace: str) -> ParentStore:
+    store = _stores.get(namespace)
+    if store is None:
+        store = _stores[namespace] = ParentStore(DOCSTORE_DIR, namespace)
+    return store
+
+
+def save_pages(
+    namespace: str,
+    docs: List[Document],
+    *,
+    replace: bool,
+    removed: Iterable[str] = (),
+) -> None:
+    """Store the crawled pages of physical `namespace`. A full crawl
+    `replace`s the stored pages, a partial recrawl updates only its own and
+    drops the `removed` ones."""
+    pages = {
+        d.metadata["source"]: d.page_content
+        for d in docs
+        if d.page_content and d.metadata.get("source")
+    }
+    removed = list(removed)
+    if pages or replace or removed:
+        get_store(namespace).write(pages, replace=replace, removed=removed)
+
+
+def drop(namespace: str) -> None:
+    get_store(namespace).drop()
+    _stores.pop(namespace, None)
+
+
+def copy_pages(namespace: str, output: Path) -> bool:
+    """Copy the live version of `namespace`'s pages to `output`, for
+    snapshots. False when it has none."""
+    pages = get_store(namespace).pages
+    if pages is None:
+        return False
+    shutil.copytree(pages.path, output)
+    return True
+
+
+def load_pages(namespace: str, path: Path) -> None:
+    """Publish pages copied by `copy_pages` as the live version of
+    `namespace`."""
+    store = get_store(namespace)
+    store.directory.mkdir(parents=True, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    staging = store.directory / f".{version}.tmp"
+    shutil.copytree(path, staging)
+
+    manifest = json.loads((staging / "manifest.json").read_text())
+    manifest.update(namespace=namespace, version=version, created=time.time())
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    publish_version(store.directory, staging, version)
+    store._checked = 0.0
+    logger.info(
+        "Parent documents loaded",
+        extra={"namespace": namespace, "version": version, "pages": manifest["pages"]},
+    )
+
+
+def locate(page: str, doc: Document) -> Optional[Tuple[int, int]]:
+    text = doc.page_content or ""
+    start = doc.metadata.get("start_index")
+    if start is not None and page.startswith(text, int(start)):
+        return int(start), int(start) + len(text)
+    found = page.find(text) if text else -1
+    return (found, found + len(text)) if found >= 0 else None
+
+
+def parent_span(
+    page: str, sections: np.ndarray, start: int, end: int, budget: int
+) -> Tuple[int, int]:
+    """The widest of page, section or paragraph-aligned window around
+    `page[start:end]` that fits in `budget` characters."""
+    if len(page) <= budget:
+        return 0, len(page)
+
+    i = int(np.searchsorted(sections, start, side="right")) - 1
+    j = int(np.searchsorted(sections, end, side="left"))
+    section_lo = int(sections[i]) if i >= 0 else 0
+    section_hi = int(sections[j]) if j < len(sections) else len(page)
+    if section_hi - section_lo <= budget:
+        return section_lo, section_hi
+
+    extra = budget - (end - start)
+    if extra <= 0:
+        return start, end
+    lo = max(section_lo, start - extra // 2)
+    hi = min(section_hi, end + extra - (start - lo))
+    lo = max(section_lo, hi - budget)
+
+    # Whole paragraphs only.
+    cut = page.find("\n\n", lo, start)
+    if cut >= 0:
+        lo = cut + 2
+    cut = page.rfind("\n\n", end, hi)
+    if cut >= 0:
+        hi = cut
+    return lo, hi
+
+
+def expand_documents(
+    docs: List[Document],
+    namespaces: List[str],
+    *,
+    max_chars: int,
+    span_chars: int = PARENT_SPAN_CHARS,
+) -> List[Document]:
+    """Replace each chunk with the surrounding span of its page.
+
+    Chunks are widened in rank order, each to at most `span_chars`, until
+    `max_chars` is used up; lower ranked chunks that no longer fit are left
+    out, so the context holds fewer, longer passages. Spans of the same page
+    that overlap are merged into the higher ranked one.
+    """
+    stores = [get_store(ns) for ns in namespaces]
+    total = 0
+    # Per source: [lo, hi, index into `expanded`].
+    spans: Dict[str, List[List[int]]] = {}
+    expanded: List[Document] = []
+
+    for doc in docs:
+        text = (doc.page_content or "").strip()
+        remaining = max_chars - total
+        if len(text) > remaining:
+            continue
+        budget = max(min(span_chars, remaining), len(text))
+        source = doc.metadata.get("source", "")
+
+        parent = next(
+            (found for found in (s.page(source) for s in stores) if found), None
+        )
+        located = locate(parent[0], doc) if parent else None
+        if located is None:
+            expanded.append(doc)
+            total += len(text)
+            continue
+
+        page, sections = parent
+        lo, hi = parent_span(page, sections, *located, budget)
+
+        merged = None
+        for span in spans.get(source, []):
+            if lo <= span[1] and span[0] <= hi:
+                merged = span
+                break
+
+        if merged is None:
+            content = page[lo:hi].strip()
+            spans.setdefault(source, []).append([lo, hi, len(expanded)])
+            expanded.append(
+                Document(
+                    id=doc.id,
+                    page_content=content,
+                    metadata={**doc.metadata, "parent_span": [lo, hi]},
+                )
+            )
+            total += len(content)
+            continue
+
+        earlier = expanded[merged[2]]
+        merged[0], merged[1] = min(lo, merged[0]), max(hi, merged[1])
+        content = page[merged[0] : merged[1]].strip()
+        total += len(content) - len(earlier.page_content)
+        expanded[merged[2]] = Document(
+            id=earlier.id,
+            page_content=content,
+            metadata={**earlier.metadata, "parent_span": merged[:2]},
+        )
+
+    return expanded
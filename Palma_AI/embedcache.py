@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from coalesce import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Query embeddings are looked up in a memory-mapped snapshot shared by all
+# workers on the host, then in a small per-process LRU, and only then sent to
+# the embedding model. The snapshot is one structured array,
+# `<dir>/entries.npy`, sorted by `key` (uint64 hash of the normalized query
+# text) with the float32 `vector` alongside. It is rebuilt offline (see
+# `main` below) and replaced atomically; workers pick it up on restart.
+
+
+def cache_key(text: str) -> int:
+    digest = hashlib.blake2b(normalize_query(text).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+class EmbeddingCache(Embeddings):
+    def __init__(
+        self,
+        inner: Embeddings,
+        directory: Optional[Path | str] = None,
+        max_entries: int = 10_000,
+    ):
+        self.inner = inner
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max_entries
+        self._recent: "OrderedDict[int, List[float]]" = OrderedDict()
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+        if self.directory and (self.directory / "entries.npy").exists():
+            entries = np.load(self.directory / "entries.npy", mmap_mode="r")
+            self.keys = entries["key"]
+            self.vectors = entries["vector"]
+            logger.info(
+                "Embedding cache snapshot opened",
+                extra={"entries": len(self.keys), "directory": str(self.directory)},
+            )
+
+    def lookup(self, text: str) -> Optional[List[float]]:
+        key = cache_key(text)
+        if len(self.keys):
+            i = int(np.searchsorted(self.keys, np.uint64(key)))
+            if i < len(self.keys) and int(self.keys[i]) == key:
+                return self.vectors[i].tolist()
+
+        vector = self._recent.get(key)
+        if vector is not None:
+            self._recent.move_to_end(key)
+        return vector
+
+    def remember(self, text: str, vector: List[float]) -> None:
+        self._recent[cache_key(text)] = vector
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.lookup(text)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self.remember(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.lookup(text)
+        if vector is None:
+            vector = await self.inner.aembed_query(text)
+            self.remember(text, vector)
+        return vector
+
+    # Documents are embedded once at ingest time; caching them only wastes memory.
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    def save(self, directory: Optional[Path | str] = None) -> Path:
+        """Write the snapshot plus everything learned since as a new snapshot."""
+        directory = Path(directory or self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        entries = {int(k): np.asarray(v) for k, v in zip(self.keys, self.vectors)}
+        entries.update((k, np.asarray(v)) for k, v in self._recent.items())
+        keys = sorted(entries)
+        dimensions = len(entries[keys[0]]) if keys else 0
+        snapshot = np.zeros(
+            len(keys), dtype=[("key", np.uint64), ("vector", np.float32, (dimensions,))]
+        )
+        snapshot["key"] = keys
+        if keys:
+            snapshot["vector"] = [entries[k] for k in keys]
+
+        staging = directory / f"entries.{os.getpid()}.tmp.npy"
+        np.save(staging, snapshot)
+        os.replace(staging, directory / "entries.npy")
+
+        logger.info(
+            "Embedding cache snapshot written",
+            extra={"entries": len(keys), "directory": str(directory)},
+        )
+        return directory
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Add queries to the shared query-embedding cache snapshot",
+    )
+    parser.add_argument("queries", help="Text file with one query per line")
+    parser.add_argument(
+        "--directory",
+        default=os.getenv("EMBED_CACHE_DIR", "embedding_cache"),
+        help="Snapshot directory (default: $EMBED_CACHE_DIR or ./embedding_cache)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    import providers
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = parse_args()
+
+    queries = [q.strip() for q in Path(args.queries).read_text().splitlines()]
+    queries = [q for q in queries if q]
+
+    inner = providers.get_embeddings()
+    if isinstance(inner, EmbeddingCache):
+        inner = inner.inner
+    cache = EmbeddingCache(inner, args.directory, max_entries=len(queries))
+
+    missing = [q for q in queries if cache.lookup(q) is None]
+    for start in range(0, len(missing), 256):
+        batch = missing[start : start + 256]
+        for query, vector in zip(batch, inner.embed_documents(batch)):
+            cache.remember(query, vector)
+
+    cache.save()
+    print(f"Embedded {len(missing)} new of {len(queries)} queries into {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+# Blocking work that has no async client (local index search, CPU-bound
+# rerankers, text splitting, sync-only stores) runs on one of these pools
+# rather than asyncio's default executor. The chat path and ingestion get
+# separate pools, so a running crawl cannot take the threads /chat needs.
+CHAT_EXECUTOR_THREADS = int(os.getenv("CHAT_EXECUTOR_THREADS", "32"))
+INGEST_EXECUTOR_THREADS = int(os.getenv("INGEST_EXECUTOR_THREADS", "4"))
+
+T = TypeVar("T")
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        threads = {"chat": CHAT_EXECUTOR_THREADS, "ingest": INGEST_EXECUTOR_THREADS}
+        executor = ThreadPoolExecutor(
+            max_workers=threads[name], thread_name_prefix=f"{name}-io"
+        )
+        _executors[name] = executor
+    return executor
+
+
+async def run_chat(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor("chat"), functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def run_ingest(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor("ingest"), functools.partial(fn, *args, **kwargs)
+    )
+
+
+def shutdown() -> None:
+    for name, executor in list(_executors.items()):
+        executor.shutdown(wait=False, cancel_futures=True)
+        del _executors[name]
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+# cspell ignore ainvoke agenerate
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+from pydantic import PrivateAttr
+
+import providers
+
+# Local stand-ins for OpenAI, Pinecone and Tavily. Everything here is
+# deterministic for a given seed so benchmark runs are comparable.
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag of words, L2 normalised.
+
+    Texts sharing words land close together, so retrieval over a synthetic
+    site still returns relevant chunks.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    # Cheap enough to run inline; the base class would use a thread.
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that takes `latency` seconds and echoes the prompt size.
+
+    Streaming spreads the latency evenly over the answer's words.
+    """
+
+    latency: float = 0.5
+    jitter: float = 0.0
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng.seed(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        answer = f"Scripted answer based on {prompt_chars} prompt characters."
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self._rng.gauss(self.latency, self.jitter))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._delay())
+        return self._reply(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._reply(messages)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        words = self._reply(messages).generations[0].message.content.split(" ")
+        step = self._delay() / len(words)
+        for i, word in enumerate(words):
+            await asyncio.sleep(step)
+            text = word if i == 0 else f" {word}"
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+WORDS = (
+    "account billing invoice export import report dashboard user role "
+    "permission shelf book chapter page search tag template backup restore "
+    "webhook api token login password email notification theme editor "
+    "markdown attachment image audit revision comment language setting"
+).split()
+
+
+class SyntheticSiteCrawler:
+    """Stand-in for TavilyCrawl returning a generated site of `pages` pages.
+
+    The first `volatile_pages` pages mention `revision`; bump it to make
+    those pages change between crawls. Also answers TavilyExtract-style
+    `{"urls": [...]}` calls.
+    """
+
+    def __init__(
+        self,
+        pages: int = 50,
+        words_per_page: int = 600,
+        seed: int = 0,
+        volatile_pages: int = 0,
+    ):
+        self.pages = pages
+        self.words_per_page = words_per_page
+        self.seed = seed
+        self.volatile_pages = volatile_pages
+        self.revision = 0
+        self.calls = 0
+
+    def generate(self, url: str) -> List[Dict[str, str]]:
+        base = url.rstrip("/")
+        rng = random.Random(f"{self.seed}:{base}")
+        results = []
+        for page in range(self.pages):
+            topic = WORDS[page % len(WORDS)]
+            words = [
+                topic if rng.random() < 0.1 else rng.choice(WORDS)
+                for _ in range(self.words_per_page)
+            ]
+            sentences = [
+                " ".join(words[i : i + 12]).capitalize() + "."
+                for i in range(0, len(words), 12)
+            ]
+            if page < self.volatile_pages:
+                sentences.append(f"Revision {self.revision}.")
+            results.append(
+                {
+                    "url": f"{base}/page-{page}-{topic}",
+                    "raw_content": f"# {topic.title()} guide\n\n" + " ".join(sentences),
+                }
+            )
+        return results
+
+    def invoke(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.calls += 1
+        if "urls" in params:
+            results = []
+            for site in {url.rsplit("/page-", 1)[0] for url in params["urls"]}:
+                results.extend(
+                    r for r in self.generate(site) if r["url"] in params["urls"]
+                )
+            return {"results": results}
+        # A crawl from a page of the site starts there and wraps around.
+        site = params["url"].rsplit("/page-", 1)[0]
+        results = self.generate(site)
+        first = next(
+            (i for i, r in enumerate(results) if r["url"] == params["url"]), 0
+        )
+        results = results[first:] + results[:first]
+        return {"results": results[: params.get("limit")]}
+
+    async def ainvoke(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self.invoke(params)
+
+
+class MemoryVectorStore(InMemoryVectorStore):
+    """InMemoryVectorStore that accepts the Pinecone-style `namespace` kwarg."""
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        kwargs.pop("namespace", None)
+        if "ids" not in kwargs:
+            kwargs["ids"] = [d.metadata.get("chunk_id") for d in documents]
+        return super().add_documents(documents, **kwargs)
+
+    def upsert_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        return self.add_documents(documents, **kwargs)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        return super().delete(ids)
+
+    def drop(self) -> None:
+        self.store.clear()
+
+    def similarity_search_with_vectors(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float, List[float]]]:
+        return [
+            (doc, score, self.store[doc.id]["vector"])
+            for doc, score in self.similarity_search_with_score_by_vector(embedding, k)
+        ]
+
+
+class MemoryIndex:
+    """Answers `fetch_previous_signatures` from the in-memory stores."""
+
+    def __init__(self, stores: Dict[str, MemoryVectorStore]):
+        self.stores = stores
+
+    def signature_matches(
+        self, namespace: str, sources: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
+        store = self.stores.get(namespace)
+        if store is None:
+            return []
+        sources = set(sources) if sources is not None else None
+        return [
+            {"id": doc_id, "metadata": record["metadata"]}
+            for doc_id, record in store.store.items()
+            if sources is None or record["metadata"].get("source") in sources
+        ]
+
+
+class LocalStack:
+    """One process-wide set of stand-ins, installed through `providers.use`."""
+
+    def __init__(
+        self,
+        *,
+        pages: int = 50,
+        llm_latency: float = 0.5,
+        llm_jitter: float = 0.0,
+        dimensions: int = 256,
+        seed: int = 0,
+    ):
+        self.embeddings = HashEmbeddings(dimensions)
+        self.chat_model = ScriptedChatModel(
+            latency=llm_latency, jitter=llm_jitter, seed=seed
+        )
+        self.crawler = SyntheticSiteCrawler(pages=pages, seed=seed)
+        self.stores: Dict[str, MemoryVectorStore] = {}
+
+    def vector_store(self, namespace: str) -> MemoryVectorStore:
+        if namespace not in self.stores:
+            self.stores[namespace] = MemoryVectorStore(self.embeddings)
+        return self.stores[namespace]
+
+    def install(self) -> "LocalStack":
+        providers.use(
+            embeddings=lambda: self.embeddings,
+            chat_model=lambda: self.chat_model,
+            vector_store=self.vector_store,
+            pinecone_index=lambda: MemoryIndex(self.stores),
+            crawler=lambda: self.crawler,
+            extractor=lambda: self.crawler,
+        )
+        return self
@@ -0,0 +1,75 @@
+import logging
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from coalesce import normalize_query
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+class RetrievalFallback:
+    """Recent retrieval results per namespace, used when the vector store is
+    slow or down.
+
+    An exact repeat of a recent query gets its cached documents back. Any
+    other query is answered lexically from the pool of documents recently
+    retrieved for the namespace, which on a help site covers most of the
+    frequently asked pages.
+    """
+
+    def __init__(self, max_queries: int = 256, max_docs: int = 2000):
+        self.max_queries = max_queries
+        self.max_docs = max_docs
+        self._results: Dict[str, "OrderedDict[str, List[Document]]"] = {}
+        self._pool: Dict[str, "OrderedDict[str, Document]"] = {}
+
+    def remember(self, namespace: str, query: str, docs: List[Document]) -> None:
+        key = normalize_query(query)
+        results = self._results.setdefault(namespace, OrderedDict())
+        results[key] = docs
+        results.move_to_end(key)
+        while len(results) > self.max_queries:
+            results.popitem(last=False)
+
+        pool = self._pool.setdefault(namespace, OrderedDict())
+        for doc in docs:
+            doc_key = doc.metadata.get("chunk_id") or doc.page_content
+            pool[doc_key] = doc
+            pool.move_to_end(doc_key)
+        while len(pool) > self.max_docs:
+            pool.popitem(last=False)
+
+    def lookup(
+        self, namespace: str, query: str, k: int, store=None
+    ) -> Tuple[List[Document], str]:
+        cached = self._results.get(namespace, {}).get(normalize_query(query))
+        if cached is not None:
+            return cached[:k], "cache"
+
+        # A local index carries a full BM25 index, better than the pool below.
+        lexical_search = getattr(store, "lexical_search", None)
+        if lexical_search is not None:
+            try:
+                return lexical_search(query, k), "bm25"
+            except Exception:
+                logger.exception("Lexical fallback search failed")
+
+        terms = set(tokenize(query))
+        scored = []
+        for doc in self._pool.get(namespace, {}).values():
+            counts = Counter(tokenize(doc.page_content))
+            score = sum(counts[t] for t in terms) / (1 + len(counts))
+            if score > 0:
+                scored.append((score, doc))
+
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [doc for _, doc in scored[:k]], "lexical"
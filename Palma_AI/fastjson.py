@@ -0,0 +1,24 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+# orjson is optional (pip install orjson); the stdlib encoder is used when it
+# is missing.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse for plain dict/list payloads, encoded with `dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
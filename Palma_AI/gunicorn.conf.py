@@ -0,0 +1,27 @@
+import os
+
+# Multi-worker deployment:
+#
+#   uv run gunicorn -c gunicorn.conf.py server:app
+#
+# With preload_app the master imports server.py once and forks the workers,
+# so imported code is shared copy-on-write. This is safe because nothing at
+# import time opens sockets or threads: clients are built per worker in the
+# app's lifespan step (see providers.warmup). Read-only data such as the
+# local vector index (localindex.py) and the query-embedding cache
+# (embedcache.py) is memory-mapped, so every worker reads the same page-cache
+# copy instead of holding its own.
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+timeout = 180
+graceful_timeout = 30
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = "-"
+errorlog = "-"
@@ -1,27 +1,26 @@
 import asyncio
-import os
 import hashlib
 import httpx
 import logging
-from typing import TypedDict, List, Dict, NotRequired
+import os
+from collections import defaultdict
+from typing import Any, Iterable, Optional, TypedDict, List, Dict, NotRequired
 
 # cspell ignore tavily ainvoke
 
 from langgraph.graph import StateGraph
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_tavily import TavilyCrawl as SearchCrawler
-
-try:
-    from pinecone import Pinecone as PineconeClient
-except Exception:
-    PineconeClient = None
-    import pinecone as pinecone_v7
+from langchain_core.vectorstores import VectorStore
 
 from dotenv import load_dotenv
 
+import aliases
+import docstore
+import providers
+from executors import run_ingest
+from profiling import timed_node
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(name)s %(message)s",
@@ -61,11 +60,8 @@ async def compute_delta(
         },
     )
 
-    current_map = {}
-    for idx, doc in enumerate(current_chunks):
-        chunk = doc.copy()
-        chunk.metadata.update(await build_metadata(chunk, idx))
-        current_map[chunk.metadata["chunk_id"]] = chunk
+    # Chunks carry their ids and checksums from the split node.
+    current_map = {doc.metadata["chunk_id"]: doc for doc in current_chunks}
 
     prev_ids = set(previous.keys())
     curr_ids = set(current_map.keys())
@@ -96,22 +92,89 @@ async def compute_delta(
     }
 
 
-async def fetch_previous_signatures(pinecone_index, namespace: str) -> Dict[str, Dict]:
-    logger.info("Fetching previous signatures", extra={"namespace": namespace})
+# Pinecone fetches at most this many ids per call.
+SIGNATURE_FETCH_BATCH = 100
+
 
-    results = await asyncio.to_thread(
-        lambda: pinecone_index.query(
-            vector=[0.0],
-            top_k=1,
-            include_values=False,
-            include_metadata=True,
-            filter={"namespace": {"$eq": namespace}},
+def list_signature_matches(
+    pinecone_index, namespace: str, sources: Optional[Iterable[str]]
+) -> List[Dict[str, Any]]:
+    # Vector ids are chunk ids ("<source>::chunk-<n>"), so a page's chunks
+    # share the id prefix "<source>::".
+    prefixes = [f"{source}::" for source in sources] if sources is not None else [None]
+    ids: List[str] = []
+    for prefix in prefixes:
+        for page in pinecone_index.list(prefix=prefix, namespace=namespace):
+            ids.extend(page)
+
+    matches = []
+    for start in range(0, len(ids), SIGNATURE_FETCH_BATCH):
+        fetched = pinecone_index.fetch(
+            ids=ids[start : start + SIGNATURE_FETCH_BATCH], namespace=namespace
+        )
+        for vector_id, vector in fetched.vectors.items():
+            matches.append({"id": vector_id, "metadata": vector.metadata or {}})
+    return matches
+
+
+async def alist_signature_matches(
+    async_index, namespace: str, sources: Optional[Iterable[str]]
+) -> List[Dict[str, Any]]:
+    """list_signature_matches over the asyncio index, fetching concurrently."""
+    prefixes = [f"{source}::" for source in sources] if sources is not None else [None]
+    ids: List[str] = []
+    for prefix in prefixes:
+        kwargs = {"prefix": prefix} if prefix is not None else {}
+        async for page in async_index.list(namespace=namespace, **kwargs):
+            ids.extend(page)
+
+    fetched = await asyncio.gather(
+        *(
+            async_index.fetch(
+                ids=ids[start : start + SIGNATURE_FETCH_BATCH], namespace=namespace
+            )
+            for start in range(0, len(ids), SIGNATURE_FETCH_BATCH)
         )
     )
+    return [
+        {"id": vector_id, "metadata": vector.metadata or {}}
+        for response in fetched
+        for vector_id, vector in response.vectors.items()
+    ]
+
+
+async def fetch_previous_signatures(
+    pinecone_index,
+    namespace: str,
+    sources: Optional[Iterable[str]] = None,
+    *,
+    async_index=None,
+) -> Dict[str, Dict]:
+    """Chunk id -> checksum of what the namespace holds, optionally limited
+    to the chunks of `sources`. `async_index`, when given, is used instead
+    of `pinecone_index`."""
+    logger.info("Fetching previous signatures", extra={"namespace": namespace})
+
+    sources = set(sources) if sources is not None else None
+    if async_index is not None:
+        matches = await alist_signature_matches(async_index, namespace, sources)
+    elif hasattr(pinecone_index, "signature_matches"):
+        # Local and in-memory indexes read every signature directly.
+        matches = await run_ingest(
+            pinecone_index.signature_matches, namespace, sources
+        )
+    else:
+        matches = await run_ingest(
+            list_signature_matches, pinecone_index, namespace, sources
+        )
 
     signatures = {}
-    for match in results.get("matches", []):
+    for match in matches:
         meta = match["metadata"]
+        if "chunk_id" not in meta:
+            continue
+        if sources is not None and meta.get("source") not in sources:
+            continue
         signatures[meta["chunk_id"]] = {
             "checksum": meta["checksum"],
             "vector_id": match["id"],
@@ -131,6 +194,7 @@ async def crawl_with_search_api(
     max_depth: int = 5,
     extract_depth: str = "advanced",
     headers: Dict[str, str] | None = None,
+    limit: Optional[int] = None,
 ) -> List[Document]:
 
     logger.info(
@@ -139,19 +203,28 @@ async def crawl_with_search_api(
             "url": url,
             "max_depth": max_depth,
             "extract_depth": extract_depth,
+            "limit": limit,
         },
     )
 
-    crawl_tool = SearchCrawler()
-    response = await asyncio.to_thread(
-        crawl_tool.invoke,
-        {
-            "url": url,
-            "max_depth": max_depth,
-            "extract_depth": extract_depth,
-        },
+    params = {"url": url, "max_depth": max_depth, "extract_depth": extract_depth}
+    if limit is not None:
+        params["limit"] = limit
+
+    crawl_tool = providers.get_crawler()
+    response = await crawl_tool.ainvoke(params)
+
+    documents = documents_from_response(response, url)
+
+    logger.info(
+        "Crawl completed",
+        extra={"documents": len(documents)},
     )
 
+    return documents
+
+
+def documents_from_response(response, url: str) -> List[Document]:
     items = []
     if isinstance(response, dict):
         items = (
@@ -191,9 +264,38 @@ async def crawl_with_search_api(
             )
         )
 
+    return documents
+
+
+# Tavily extracts at most this many URLs per call.
+EXTRACT_BATCH = 20
+
+
+async def extract_pages(
+    urls: List[str],
+    *,
+    extract_depth: str = "advanced",
+) -> List[Document]:
+    """Fetch just `urls` (no link following), for scheduled recrawls."""
+    logger.info("Extract started", extra={"urls": len(urls)})
+
+    extractor = providers.get_extractor()
+    responses = await asyncio.gather(
+        *(
+            extractor.ainvoke(
+                {"urls": urls[i : i + EXTRACT_BATCH], "extract_depth": extract_depth},
+            )
+            for i in range(0, len(urls), EXTRACT_BATCH)
+        )
+    )
+
+    documents: List[Document] = []
+    for response in responses:
+        documents.extend(documents_from_response(response, ""))
+
     logger.info(
-        "Crawl completed",
-        extra={"documents": len(documents)},
+        "Extract completed",
+        extra={"requested": len(urls), "documents": len(documents)},
     )
 
     return documents
@@ -213,7 +315,7 @@ async def batched(iterable, size=50):
 
 
 async def apply_delta(
-    vector_store: PineconeVectorStore,
+    vector_store: VectorStore,
     delta: Dict,
     namespace: str,
     batch_size: int = 50,
@@ -228,27 +330,73 @@ async def apply_delta(
         },
     )
 
+    # Stores with an async client (Pinecone) write without a thread; the
+    # others run on the ingest executor.
+    native = hasattr(vector_store, "aupsert_documents")
+
     new_batches = await batched(delta["new"], batch_size)
     for docs in new_batches:
-        await asyncio.to_thread(
-            lambda docs=docs: vector_store.add_documents(docs, namespace=namespace)
-        )
+        ids = [d.metadata["chunk_id"] for d in docs]
+        if native:
+            await vector_store.aupsert_documents(docs, ids=ids, namespace=namespace)
+        else:
+            await run_ingest(
+                vector_store.add_documents, docs, ids=ids, namespace=namespace
+            )
 
     changed_batches = await batched(delta["changed"], batch_size)
     for docs in changed_batches:
-        await asyncio.to_thread(
-            lambda docs=docs: vector_store.upsert_documents(docs, namespace=namespace)
-        )
+        ids = [d.metadata["chunk_id"] for d in docs]
+        if native:
+            await vector_store.aupsert_documents(docs, ids=ids, namespace=namespace)
+        else:
+            await run_ingest(
+                vector_store.upsert_documents, docs, ids=ids, namespace=namespace
+            )
 
     removed_batches = await batched(delta["removed"], batch_size)
     for ids in removed_batches:
-        await asyncio.to_thread(
-            lambda ids=ids: vector_store.delete(ids=ids, namespace=namespace)
-        )
+        if native:
+            await vector_store.adelete(ids=ids, namespace=namespace)
+        else:
+            await run_ingest(vector_store.delete, ids=ids, namespace=namespace)
 
     logger.info("Delta applied", extra={"namespace": namespace})
 
 
+# Batches written concurrently by a full rebuild.
+REBUILD_CONCURRENCY = int(os.getenv("REBUILD_CONCURRENCY", "8"))
+
+
+async def bulk_write(
+    vector_store: VectorStore,
+    chunks: List[Document],
+    namespace: str,
+    batch_size: int = 50,
+    concurrency: int = REBUILD_CONCURRENCY,
+):
+    """Write all `chunks` to an empty namespace, several batches at a time."""
+    logger.info(
+        "Bulk write started",
+        extra={"namespace": namespace, "chunks": len(chunks)},
+    )
+    native = hasattr(vector_store, "aupsert_documents")
+    slots = asyncio.Semaphore(concurrency)
+
+    async def write(docs: List[Document]):
+        ids = [d.metadata["chunk_id"] for d in docs]
+        async with slots:
+            if native:
+                await vector_store.aupsert_documents(docs, ids=ids, namespace=namespace)
+            else:
+                await run_ingest(
+                    vector_store.add_documents, docs, ids=ids, namespace=namespace
+                )
+
+    await asyncio.gather(*(write(docs) for docs in await batched(chunks, batch_size)))
+    logger.info("Bulk write completed", extra={"namespace": namespace})
+
+
 class CrawlState(TypedDict):
     url: str
     raw_docs: List[Document]
@@ -256,6 +404,26 @@ class CrawlState(TypedDict):
     delta: Dict[str, List[Document] | List[str]]
     max_depth: NotRequired[int]
     extract_depth: NotRequired[str]
+    # Recrawl only these pages; the delta is then limited to their chunks.
+    urls: NotRequired[List[str]]
+    # Fetch at most this many pages. A crawl that reaches the limit is
+    # treated like a recrawl of the pages it fetched.
+    limit: NotRequired[int]
+    # Crawl from this page of the site instead of its root; also treated
+    # like a recrawl of the pages it fetched.
+    start: NotRequired[str]
+    # Pages among `urls` believed gone; if they cannot be fetched, their
+    # chunks and parent pages are removed.
+    unlisted: NotRequired[List[str]]
+    # Set by `crawl` when the result does not cover the whole site.
+    partial: NotRequired[bool]
+    # Set by `crawl`: the `unlisted` pages that could not be fetched.
+    removed: NotRequired[List[str]]
+    # Write a fresh version of the namespace and swap its alias instead of
+    # applying a delta to the live one.
+    rebuild: NotRequired[bool]
+    # Physical namespace written to (see aliases.py).
+    target: NotRequired[str]
 
 
 graph = StateGraph(CrawlState)
@@ -264,12 +432,27 @@ graph = StateGraph(CrawlState)
 async def crawl(state: CrawlState) -> CrawlState:
     logger.info("Graph crawl node entered", extra={"url": state["url"]})
 
-    docs = await crawl_with_search_api(
-        state["url"],
-        max_depth=state.get("max_depth", 5),
-        extract_depth=state.get("extract_depth", "advanced"),
+    if state.get("urls"):
+        docs = await extract_pages(
+            state["urls"],
+            extract_depth=state.get("extract_depth", "advanced"),
+        )
+    else:
+        docs = await crawl_with_search_api(
+            state.get("start") or state["url"],
+            max_depth=state.get("max_depth", 5),
+            extract_depth=state.get("extract_depth", "advanced"),
+            limit=state.get("limit"),
+        )
+
+    limit = state.get("limit")
+    sources = {doc.metadata["source"] for doc in docs}
+    partial = (
+        bool(state.get("urls") or state.get("start"))
+        or (limit is not None and len(sources) >= limit)
     )
-    return {**state, "raw_docs": docs}
+    removed = [u for u in state.get("unlisted", []) if u not in sources]
+    return {**state, "raw_docs": docs, "partial": partial, "removed": removed}
 
 
 async def split(state: CrawlState) -> CrawlState:
@@ -278,11 +461,19 @@ async def split(state: CrawlState) -> CrawlState:
         extra={"raw_docs": len(state["raw_docs"])},
     )
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=120)
-    chunks = await asyncio.to_thread(splitter.split_documents, state["raw_docs"])
+    # start_index locates each chunk in its page for parent expansion.
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=800, chunk_overlap=120, add_start_index=True
+    )
+    chunks = await run_ingest(splitter.split_documents, state["raw_docs"])
 
-    for idx, chunk in enumerate(chunks):
-        chunk.metadata.update(await build_metadata(chunk, idx))
+    # Numbered per page so a page's chunk ids do not depend on which other
+    # pages were crawled with it.
+    per_source: Dict[str, int] = defaultdict(int)
+    for chunk in chunks:
+        source = chunk.metadata["source"]
+        chunk.metadata.update(await build_metadata(chunk, per_source[source]))
+        per_source[source] += 1
 
     logger.info(
         "Split completed",
@@ -293,42 +484,91 @@ async def split(state: CrawlState) -> CrawlState:
 
 
 async def diff(state: CrawlState) -> CrawlState:
-    namespace = state["url"]
+    if state.get("rebuild"):
+        # Nothing to compare against: every chunk goes to the new version.
+        target = aliases.new_version(state["url"])
+        logger.info("Rebuild target chosen", extra={"target": target})
+        delta = {"new": state["chunks"], "changed": [], "removed": []}
+        return {**state, "target": target, "delta": delta}
+
+    namespace = aliases.resolve(state["url"])
     logger.info("Diff node started", extra={"namespace": namespace})
 
-    if PineconeClient is not None:
-        pinecone_client = PineconeClient(api_key=os.environ["PINECONE_API_KEY"])
-        index = pinecone_client.Index(os.environ["PINECONE_INDEX"])
-    else:
-        pinecone_v7.init(api_key=os.environ["PINECONE_API_KEY"])
-        index = pinecone_v7.Index(os.environ["PINECONE_INDEX"])
-
-    previous = await fetch_previous_signatures(index, namespace)
+    index = providers.get_pinecone_index()
+
+    # A partial recrawl only speaks for the pages it fetched, and for the
+    # pages found removed; pages it did not fetch (or that failed) keep their
+    # chunks.
+    sources = None
+    if state.get("partial"):
+        sources = {doc.metadata["source"] for doc in state["raw_docs"]}
+        sources.update(state.get("removed", []))
+
+    previous = await fetch_previous_signatures(
+        index,
+        namespace,
+        sources,
+        async_index=await providers.get_async_pinecone_index(),
+    )
     delta = await compute_delta(previous, state["chunks"])
 
-    return {**state, "delta": delta}
+    return {**state, "target": namespace, "delta": delta}
 
 
-async def persist(state: CrawlState) -> CrawlState:
-    logger.info("Persist node started", extra={"namespace": state["url"]})
+async def write_target(state: CrawlState) -> None:
+    target = state["target"]
+    vector_store = providers.get_vector_store(target)
 
-    vector_store = PineconeVectorStore.from_existing_index(
-        index_name=os.environ["PINECONE_INDEX"],
-        embedding=OpenAIEmbeddings(model="text-embedding-3-small"),
-        namespace=state["url"],
+    if state.get("rebuild"):
+        await bulk_write(vector_store, state["chunks"], namespace=target)
+    else:
+        await apply_delta(vector_store, state["delta"], namespace=target)
+
+    # The local index stages writes and publishes them as one new version.
+    commit = getattr(vector_store, "commit", None)
+    if commit is not None:
+        await run_ingest(commit)
+
+    # Whole pages for small-to-big retrieval; a partial recrawl only
+    # replaces the pages it fetched and drops the removed ones.
+    await run_ingest(
+        docstore.save_pages,
+        target,
+        state["raw_docs"],
+        replace=not state.get("partial"),
+        removed=state.get("removed", []),
     )
 
-    await apply_delta(vector_store, state["delta"], namespace=state["url"])
 
-    logger.info("Persist completed", extra={"namespace": state["url"]})
+async def persist(state: CrawlState) -> CrawlState:
+    target = state["target"]
+    logger.info("Persist node started", extra={"namespace": target})
+
+    if state.get("rebuild") and not state["chunks"]:
+        raise RuntimeError("Rebuild produced no chunks; alias left unchanged")
+
+    try:
+        await write_target(state)
+    except Exception:
+        if state.get("rebuild"):
+            # Never swapped in; collected like a replaced version.
+            aliases.retire(target)
+            aliases.schedule_collection()
+        raise
+
+    if state.get("rebuild"):
+        if aliases.swap(state["url"], target):
+            aliases.schedule_collection()
+
+    logger.info("Persist completed", extra={"namespace": target})
 
     return state
 
 
-graph.add_node("crawl", crawl)
-graph.add_node("split", split)
-graph.add_node("diff", diff)
-graph.add_node("persist", persist)
+graph.add_node("crawl", timed_node("crawl", crawl))
+graph.add_node("split", timed_node("split", split))
+graph.add_node("diff", timed_node("diff", diff))
+graph.add_node("persist", timed_node("persist", persist))
 graph.set_entry_point("crawl")
 graph.add_edge("crawl", "split")
 graph.add_edge("split", "diff")
@@ -344,19 +584,47 @@ async def run_pipeline(
     max_depth: int = 5,
     extract_depth: str = "advanced",
     headers: Dict[str, str] | None = None,
-):
+    urls: Optional[List[str]] = None,
+    rebuild: bool = False,
+    limit: Optional[int] = None,
+    start: Optional[str] = None,
+    unlisted: Optional[List[str]] = None,
+) -> CrawlState:
+    """Crawl `url` and sync its namespace, or with `urls` refresh only those
+    pages. `limit` caps the pages a crawl fetches and `start` crawls from a
+    page of the site instead of its root. Pages in `unlisted` (among `urls`)
+    that cannot be fetched are removed. With `rebuild` the crawl is written
+    to a new version of the namespace, which replaces the live one once
+    complete. Returns the final pipeline state."""
+    if rebuild and (urls or limit is not None or start):
+        raise ValueError(
+            "A rebuild crawls the whole site; drop urls, limit and start"
+        )
     logger.info(
         "Pipeline started",
         extra={
             "url": url,
             "max_depth": max_depth,
             "extract_depth": extract_depth,
+            "pages": len(urls) if urls else None,
+            "limit": limit,
+            "rebuild": rebuild,
         },
     )
 
-    await app.ainvoke(
-            {"url": url, "max_depth": max_depth, "extract_depth": extract_depth}
-        )
-    
+    input_state = {"url": url, "max_depth": max_depth, "extract_depth": extract_depth}
+    if urls:
+        input_state["urls"] = urls
+    if limit is not None:
+        input_state["limit"] = limit
+    if start:
+        input_state["start"] = start
+    if unlisted:
+        input_state["unlisted"] = unlisted
+    if rebuild:
+        input_state["rebuild"] = True
+    state = await app.ainvoke(input_state)
+
     logger.info("Pipeline completed", extra={"url": url})
+    return state
 
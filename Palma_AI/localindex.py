@@ -0,0 +1,729 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from fallback import tokenize
+
+logger = logging.getLogger(__name__)
+
+# A local, file-backed alternative to Pinecone for a namespace. Every array
+# is stored as a plain .npy/.bin file and opened with mmap, so the gunicorn
+# workers on one host share a single copy through the page cache instead of
+# each holding its own.
+#
+# Layout of one namespace:
+#
+#   <root>/<slug>/CURRENT              name of the live version directory
+#   <root>/<slug>/<version>/
+#       manifest.json                  namespace, count, dimensions, dtype
+#       vectors.npy                    (count, dimensions), L2 normalised
+#       search.npy, search.scale.npy   compact search matrix, see below
+#       ids.bin, ids.offsets.npy       utf-8 strings, one per row
+#       texts.bin, texts.offsets.npy
+#       metadata.bin, metadata.offsets.npy   one JSON object per row
+#       bm25.indptr.npy, bm25.docs.npy, bm25.weights.npy
+#
+# Writers build a complete new version and then swap CURRENT atomically;
+# readers notice the change and reopen. Old versions are removed once two
+# newer ones exist, so readers still mapping them are never pulled from
+# under (and on POSIX their pages live on until unmapped anyway).
+
+# Storage of the search matrix, fixed per version when it is written.
+# LOCAL_INDEX_SEARCH_DIMS > 0 searches only the leading dimensions
+# (Matryoshka-style truncation, renormalised) and LOCAL_INDEX_DTYPE=int8
+# stores them quantized (symmetric, one scale per row). With either set,
+# search.npy holds the compact matrix; vectors.npy keeps the full float32
+# vectors unless LOCAL_INDEX_KEEP_FULL=0, and the best
+# k * LOCAL_INDEX_RESCORE compact matches are rescored against them (0
+# disables rescoring). Being memory-mapped, only the rows rescored or
+# returned to MMR are ever paged in. int8 only pays off on a truncated
+# matrix, so it requires truncation and the full vectors; float16 searched
+# slower than float32 and is not offered.
+LOCAL_INDEX_DTYPES = ("float32", "int8")
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+LOCAL_INDEX_SEARCH_DIMS = int(os.getenv("LOCAL_INDEX_SEARCH_DIMS", "0"))
+LOCAL_INDEX_KEEP_FULL = os.getenv("LOCAL_INDEX_KEEP_FULL", "1") == "1"
+LOCAL_INDEX_RESCORE = int(os.getenv("LOCAL_INDEX_RESCORE", "4"))
+
+# Compact rows are widened to float32 this many at a time for the matmul;
+# small blocks keep the widened copy in cache.
+SEARCH_BLOCK_ROWS = 256
+
+BM25_BUCKETS = 1 << 18
+BM25_K1 = 1.2
+BM25_B = 0.75
+REOPEN_CHECK_SECONDS = 1.0
+
+
+def namespace_slug(namespace: str) -> str:
+    readable = re.sub(r"[^A-Za-z0-9]+", "-", namespace).strip("-")[:60]
+    digest = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:10]
+    return f"{readable}-{digest}"
+
+
+def term_bucket(term: str) -> int:
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % BM25_BUCKETS
+
+
+class StringsWriter:
+    """Streams strings into the `<name>.bin` / `<name>.offsets.npy` pair
+    that `MappedStrings` reads."""
+
+    def __init__(self, path: Path, name: str):
+        self.path = path
+        self.name = name
+        self.file = open(path / f"{name}.bin", "wb")
+        self.offsets = [0]
+
+    def append(self, value: str) -> None:
+        data = value.encode("utf-8")
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self.file.close()
+        np.save(
+            self.path / f"{self.name}.offsets.npy",
+            np.asarray(self.offsets, dtype=np.int64),
+        )
+
+
+def write_strings(path: Path, name: str, values: Iterable[str]) -> None:
+    writer = StringsWriter(path, name)
+    for value in values:
+        writer.append(value)
+    writer.close()
+
+
+class MappedStrings:
+    def __init__(self, path: Path, name: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        self.offsets = np.load(path / f"{name}.offsets.npy", mmap_mode=mode)
+        size = int(self.offsets[-1])
+        if size == 0:
+            self.data = np.zeros(0, dtype=np.uint8)
+        elif mmap:
+            self.data = np.memmap(path / f"{name}.bin", dtype=np.uint8, mode="r")
+        else:
+            self.data = np.fromfile(path / f"{name}.bin", dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.data[start:end].tobytes().decode("utf-8")
+
+
+def term_counts(texts: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(row, bucket, term frequency) triples of `texts`, rows from 0."""
+    rows: List[int] = []
+    buckets: List[int] = []
+    tfs: List[int] = []
+    for row, text in enumerate(texts):
+        for bucket, tf in Counter(term_bucket(t) for t in tokenize(text)).items():
+            rows.append(row)
+            buckets.append(bucket)
+            tfs.append(tf)
+    return (
+        np.asarray(rows, dtype=np.int32),
+        np.asarray(buckets, dtype=np.int32),
+        np.asarray(tfs, dtype=np.float32),
+    )
+
+
+def bm25_postings(
+    rows: np.ndarray, buckets: np.ndarray, tfs: np.ndarray, count: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Hashed-term BM25 postings in CSR form: bucket -> (doc ids, weights),
+    from the term triples of `count` documents."""
+    lengths = np.bincount(rows, weights=tfs, minlength=count)
+    avg_length = float(lengths.mean()) if count else 0.0
+
+    df = np.bincount(buckets, minlength=BM25_BUCKETS)
+    idf = np.log(1 + (count - df[buckets] + 0.5) / (df[buckets] + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / (avg_length or 1.0))
+    weights = idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+    order = np.lexsort((rows, buckets))
+    indptr = np.zeros(BM25_BUCKETS + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+    return indptr, rows[order].astype(np.int32), weights[order].astype(np.float32)
+
+
+def build_bm25(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return bm25_postings(*term_counts(texts), len(texts))
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    scale = np.abs(vectors).max(axis=1) / 127
+    scale = np.where(scale == 0, 1, scale).astype(np.float32)
+    return np.round(vectors / scale[:, None]).astype(np.int8), scale
+
+
+class CompactVectors:
+    """Row access to a compact matrix as float32, standing in for
+    vectors.npy when a version was written without it."""
+
+    def __init__(self, data: np.ndarray, scale: Optional[np.ndarray]):
+        self.data = data
+        self.scale = scale
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.data.shape
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows = np.asarray(self.data[key], dtype=np.float32)
+        if self.scale is not None:
+            scale = np.asarray(self.scale[key], dtype=np.float32)
+            rows = rows * (scale[..., None] if rows.ndim == 2 else scale)
+        return rows
+
+
+class IndexWriter:
+    """Writes a new version of `namespace` under `directory`, `count` rows
+    of `dimensions` at a time in any number of `append` calls.
+
+    Vectors go straight into memory-mapped output files, so only the slice
+    being appended is held in memory (plus a few bytes per term for BM25).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        namespace: str,
+        count: int,
+        dimensions: int,
+        *,
+        dtype: str = LOCAL_INDEX_DTYPE,
+        search_dims: int = LOCAL_INDEX_SEARCH_DIMS,
+        keep_full: bool = LOCAL_INDEX_KEEP_FULL,
+    ):
+        if dtype not in LOCAL_INDEX_DTYPES:
+            raise ValueError(f"LOCAL_INDEX_DTYPE must be one of {LOCAL_INDEX_DTYPES}")
+        truncated = 0 < search_dims < dimensions
+        if dtype == "int8" and dimensions and not (truncated and keep_full):
+            raise ValueError(
+                "int8 storage needs LOCAL_INDEX_SEARCH_DIMS below the vector "
+                f"size ({dimensions}) and LOCAL_INDEX_KEEP_FULL=1 for rescoring"
+            )
+
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.namespace = namespace
+        self.count = count
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.version = f"v{time.time_ns()}"
+        self.staging = directory / f".{self.version}.tmp"
+        self.staging.mkdir()
+
+        self.search_dims = search_dims if truncated else dimensions
+        self.compact = dtype != "float32" or self.search_dims < dimensions
+        self.keep_full = keep_full or not self.compact
+
+        def output(name: str, dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+            return np.lib.format.open_memmap(
+                self.staging / name, mode="w+", dtype=dtype, shape=shape
+            )
+
+        self.vectors = self.search = self.scale = None
+        if self.keep_full:
+            self.vectors = output("vectors.npy", "float32", (count, dimensions))
+        if self.compact:
+            self.search = output("search.npy", dtype, (count, self.search_dims))
+            if dtype == "int8":
+                self.scale = output("search.scale.npy", "float32", (count,))
+
+        self.ids = StringsWriter(self.staging, "ids")
+        self.texts = StringsWriter(self.staging, "texts")
+        self.metadata = StringsWriter(self.staging, "metadata")
+        self.terms: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.rows = 0
+
+    def append(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict],
+        vectors: np.ndarray,
+    ) -> None:
+        start, end = self.rows, self.rows + len(ids)
+        if end > self.count:
+            raise ValueError(f"More than the {self.count} rows declared")
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = normalise(vectors.reshape(len(ids), self.dimensions))
+        if self.vectors is not None:
+            self.vectors[start:end] = vectors
+        if self.search is not None:
+            search = normalise(vectors[:, : self.search_dims])
+            if self.scale is not None:
+                search, self.scale[start:end] = quantize_int8(search)
+            self.search[start:end] = search
+
+        for doc_id, text, meta in zip(ids, texts, metadatas):
+            self.ids.append(doc_id)
+            self.texts.append(text)
+            self.metadata.append(json.dumps(meta))
+
+        rows, buckets, tfs = term_counts(texts)
+        self.terms.append((rows + start, buckets, tfs))
+        self.rows = end
+
+    def publish(self) -> Path:
+        """Finish the version and make it live."""
+        if self.rows != self.count:
+            raise ValueError(f"{self.rows} rows written, {self.count} declared")
+
+        for matrix in (self.vectors, self.search, self.scale):
+            if matrix is not None:
+                matrix.flush()
+        self.vectors = self.search = self.scale = None
+        for strings in (self.ids, self.texts, self.metadata):
+            strings.close()
+
+        terms = [np.concatenate(parts) for parts in zip(*self.terms)] or [
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.float32),
+        ]
+        self.terms = []
+        indptr, docs, weights = bm25_postings(*terms, self.count)
+        np.save(self.staging / "bm25.indptr.npy", indptr)
+        np.save(self.staging / "bm25.docs.npy", docs)
+        np.save(self.staging / "bm25.weights.npy", weights)
+
+        manifest = {
+            "namespace": self.namespace,
+            "version": self.version,
+            "count": self.count,
+            "dimensions": int(self.dimensions),
+            "dtype": self.dtype if self.compact else "float32",
+            "search_dims": int(self.search_dims),
+            "full_vectors": self.keep_full,
+            "created": time.time(),
+        }
+        (self.staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+        publish_version(self.directory, self.staging, self.version)
+        logger.info(
+            "Local index written",
+            extra={
+                "namespace": self.namespace,
+                "version": self.version,
+                "count": self.count,
+            },
+        )
+        return self.directory / self.version
+
+
+def write_index(
+    directory: Path,
+    namespace: str,
+    ids: List[str],
+    texts: List[str],
+    metadatas: List[Dict],
+    vectors: np.ndarray,
+    *,
+    dtype: str = LOCAL_INDEX_DTYPE,
+    search_dims: int = LOCAL_INDEX_SEARCH_DIMS,
+    keep_full: bool = LOCAL_INDEX_KEEP_FULL,
+) -> Path:
+    """Write a new version of `namespace` under `directory` and make it live."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(ids), -1)
+    writer = IndexWriter(
+        directory,
+        namespace,
+        len(ids),
+        vectors.shape[1],
+        dtype=dtype,
+        search_dims=search_dims,
+        keep_full=keep_full,
+    )
+    writer.append(ids, texts, metadatas, vectors)
+    return writer.publish()
+
+
+def publish_version(directory: Path, staging: Path, version: str) -> None:
+    """Move a fully written `staging` directory into place as `version` and
+    point CURRENT at it."""
+    os.replace(staging, directory / version)
+    pointer = directory / f".CURRENT.{os.getpid()}.tmp"
+    pointer.write_text(version)
+    os.replace(pointer, directory / "CURRENT")
+    collect_versions(directory)
+
+
+def collect_versions(directory: Path, keep: int = 2) -> None:
+    versions = sorted(p for p in directory.glob("v*") if p.is_dir())
+    for old in versions[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+class LocalIndex:
+    """One immutable version of a namespace, opened read-only."""
+
+    def __init__(self, path: Path, mmap: bool = True):
+        mode = "r" if mmap else None
+        self.path = path
+        self.manifest = json.loads((path / "manifest.json").read_text())
+
+        self.search_vectors = self.search_scale = None
+        if (path / "search.npy").exists():
+            self.search_vectors = np.load(path / "search.npy", mmap_mode=mode)
+            if (path / "search.scale.npy").exists():
+                self.search_scale = np.load(path / "search.scale.npy", mmap_mode=mode)
+
+        self.rescore = 0
+        if (path / "vectors.npy").exists():
+            self.vectors = np.load(path / "vectors.npy", mmap_mode=mode)
+            if self.search_vectors is not None:
+                self.rescore = LOCAL_INDEX_RESCORE
+        else:
+            self.vectors = CompactVectors(self.search_vectors, self.search_scale)
+        self.ids = MappedStrings(path, "ids", mmap)
+        self.texts = MappedStrings(path, "texts", mmap)
+        self.metadata = MappedStrings(path, "metadata", mmap)
+        self.bm25_indptr = np.load(path / "bm25.indptr.npy", mmap_mode=mode)
+        self.bm25_docs = np.load(path / "bm25.docs.npy", mmap_mode=mode)
+        self.bm25_weights = np.load(path / "bm25.weights.npy", mmap_mode=mode)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def document(self, row: int) -> Document:
+        return Document(
+            id=self.ids[row],
+            page_content=self.texts[row],
+            metadata=json.loads(self.metadata[row]),
+        )
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def compact_scores(self, query: np.ndarray) -> np.ndarray:
+        matrix = self.search_vectors
+        query = normalise(query[: matrix.shape[1]])
+        if matrix.dtype == np.float32:
+            scores = matrix @ query
+        else:
+            scores = np.empty(len(matrix), dtype=np.float32)
+            buffer = np.empty((SEARCH_BLOCK_ROWS, matrix.shape[1]), dtype=np.float32)
+            for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+                block = matrix[start : start + SEARCH_BLOCK_ROWS]
+                widened = buffer[: len(block)]
+                widened[...] = block
+                np.dot(widened, query, out=scores[start : start + len(block)])
+        if self.search_scale is not None:
+            scores *= self.search_scale
+        return scores
+
+    def search(self, vector: List[float], k: int) -> List[Tuple[int, float]]:
+        if not len(self):
+            return []
+        query = normalise(np.asarray(vector, dtype=np.float32))
+        if self.search_vectors is None:
+            return self._top(self.vectors @ query, k)
+
+        scores = self.compact_scores(query)
+        if not self.rescore:
+            return self._top(scores, k)
+
+        # Rescore the best compact matches with the full vectors, reading
+        # the rows in file order.
+        rows = np.sort([row for row, _ in self._top(scores, k * self.rescore)])
+        exact = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        return [(int(rows[i]), float(exact[i])) for i in np.argsort(-exact)[:k]]
+
+    def lexical_search(self, text: str, k: int) -> List[Tuple[int, float]]:
+        if not len(self):
+            return []
+        buckets = {term_bucket(t) for t in tokenize(text)}
+        spans = [(self.bm25_indptr[b], self.bm25_indptr[b + 1]) for b in buckets]
+        spans = [(int(s), int(e)) for s, e in spans if e > s]
+        if not spans:
+            return []
+        docs = np.concatenate([self.bm25_docs[s:e] for s, e in spans])
+        weights = np.concatenate([self.bm25_weights[s:e] for s, e in spans])
+        scores = np.bincount(docs, weights=weights, minlength=len(self))
+        return [(row, score) for row, score in self._top(scores, k) if score > 0]
+
+
+def list_namespaces(root: Path) -> List[str]:
+    namespaces = []
+    for current in Path(root).glob("*/CURRENT"):
+        version = current.parent / current.read_text().strip()
+        manifest = json.loads((version / "manifest.json").read_text())
+        namespaces.append(manifest["namespace"])
+    return namespaces
+
+
+class LocalIndexStore(VectorStore):
+    """VectorStore over the live version of one namespace in a local index.
+
+    Writes are staged in memory and published as a new version by
+    `commit()`, which the ingestion `persist` step calls after applying a
+    delta.
+    """
+
+    def __init__(self, root: Path | str, namespace: str, embedding: Embeddings):
+        self.root = Path(root)
+        self.namespace = namespace
+        self.directory = self.root / namespace_slug(namespace)
+        self.embedding = embedding
+
+        self._index: Optional[LocalIndex] = None
+        self._version: Optional[str] = None
+        self._checked = 0.0
+        self._staged: Dict[str, Tuple[str, Dict, List[float]]] = {}
+        self._deleted: set = set()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def index(self) -> Optional[LocalIndex]:
+        now = time.monotonic()
+        if self._index is not None and now - self._checked < REOPEN_CHECK_SECONDS:
+            return self._index
+        self._checked = now
+
+        try:
+            version = (self.directory / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return None
+
+        if version != self._version:
+            self._index = LocalIndex(self.directory / version)
+            self._version = version
+            logger.info(
+                "Local index opened",
+                extra={"namespace": self.namespace, "version": version},
+            )
+        return self._index
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        index = self.index
+        if index is None:
+            return []
+        return [(index.document(row), score) for row, score in index.search(embedding, k)]
+
+    def similarity_search_with_vectors(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        index = self.index
+        if index is None:
+            return []
+        return [
+            (index.document(row), score, index.vectors[row])
+            for row, score in index.search(embedding, k)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k)]
+
+    def lexical_search(self, query: str, k: int = 4) -> List[Document]:
+        index = self.index
+        if index is None:
+            return []
+        return [index.document(row) for row, _ in index.lexical_search(query, k)]
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [m.get("chunk_id") or str(hash(t)) for t, m in zip(texts, metadatas)]
+        vectors = self.embedding.embed_documents(texts)
+        for doc_id, text, meta, vector in zip(ids, texts, metadatas, vectors):
+            self._staged[doc_id] = (text, meta, vector)
+            self._deleted.discard(doc_id)
+        return ids
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        kwargs.pop("namespace", None)
+        ids = kwargs.pop("ids", None) or [
+            d.id or d.metadata.get("chunk_id") for d in documents
+        ]
+        return self.add_texts(
+            [d.page_content for d in documents],
+            [d.metadata for d in documents],
+            ids=ids,
+        )
+
+    def upsert_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        return self.add_documents(documents, **kwargs)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        for doc_id in ids or []:
+            self._staged.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+    def drop(self) -> None:
+        """Delete every version of this namespace (retired alias targets)."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._index = None
+        self._version = None
+        self._staged.clear()
+        self._deleted.clear()
+
+    def signatures(self) -> Dict[str, Dict]:
+        index = self.index
+        if index is None:
+            return {}
+        signatures = {}
+        for row in range(len(index)):
+            meta = json.loads(index.metadata[row])
+            if "chunk_id" in meta:
+                signatures[meta["chunk_id"]] = {
+                    "checksum": meta.get("checksum"),
+                    "source": meta.get("source"),
+                    "vector_id": index.ids[row],
+                }
+        return signatures
+
+    def commit(self) -> None:
+        if not self._staged and not self._deleted:
+            return
+        index = self.index
+        if index is None and not self._staged:
+            # Nothing written yet, so nothing to delete.
+            self._deleted.clear()
+            return
+
+        ids: List[str] = []
+        texts: List[str] = []
+        metadatas: List[Dict] = []
+        kept_rows: List[int] = []
+
+        if index is not None:
+            for row in range(len(index)):
+                doc_id = index.ids[row]
+                if doc_id in self._deleted or doc_id in self._staged:
+                    continue
+                ids.append(doc_id)
+                texts.append(index.texts[row])
+                metadatas.append(json.loads(index.metadata[row]))
+                kept_rows.append(row)
+
+        parts = []
+        if kept_rows:
+            parts.append(np.asarray(index.vectors[kept_rows], dtype=np.float32))
+        if self._staged:
+            staged = np.asarray([v for _, _, v in self._staged.values()], dtype=np.float32)
+            if parts and parts[0].shape[1] < staged.shape[1]:
+                # A version written without full vectors only has the
+                # truncated dimensions to carry over.
+                staged = staged[:, : parts[0].shape[1]]
+            parts.append(staged)
+            for doc_id, (text, meta, _) in self._staged.items():
+                ids.append(doc_id)
+                texts.append(text)
+                metadatas.append(meta)
+
+        if parts:
+            vectors = np.concatenate(parts)
+        else:
+            # Every row was deleted; keep the previous version's width.
+            vectors = np.zeros((0, index.vectors.shape[1]), dtype=np.float32)
+        write_index(self.directory, self.namespace, ids, texts, metadatas, vectors)
+
+        self._staged.clear()
+        self._deleted.clear()
+        self._checked = 0.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict]] = None,
+        *,
+        root: Path | str = "local_index",
+        namespace: str = "default",
+        **kwargs: Any,
+    ) -> "LocalIndexStore":
+        store = cls(root, namespace, embedding)
+        store.add_texts(texts, metadatas, **kwargs)
+        store.commit()
+        return store
+
+
+class LocalSignatureIndex:
+    """Answers `fetch_previous_signatures` for the local backend."""
+
+    def __init__(self, root: Path | str, embedding: Embeddings):
+        self.root = Path(root)
+        self.embedding = embedding
+
+    def signature_matches(
+        self, namespace: str, sources: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Every chunk signature of `namespace`, or of the chunks of
+        `sources`, in the shape of Pinecone fetch results."""
+        store = LocalIndexStore(self.root, namespace, self.embedding)
+        sources = set(sources) if sources is not None else None
+        return [
+            {
+                "id": sig["vector_id"],
+                "metadata": {
+                    "chunk_id": cid,
+                    "checksum": sig["checksum"],
+                    "source": sig["source"],
+                },
+            }
+            for cid, sig in store.signatures().items()
+            if sources is None or sig["source"] in sources
+        ]
@@ -4,6 +4,7 @@ import os
 
 from dotenv import load_dotenv
 
+import providers
 from injestion import run_pipeline
 
 
@@ -38,6 +39,16 @@ def parse_args():
 		choices=["basic", "advanced"],
 		help="Extraction depth (default: advanced)",
 	)
+	parser.add_argument(
+		"--rebuild",
+		action="store_true",
+		help="Write a fresh version of the namespace and swap it in when done",
+	)
+	parser.add_argument(
+		"--faq",
+		default=os.getenv("FAQ_FILE"),
+		help="Questions to warm the caches with after ingesting (default: $FAQ_FILE)",
+	)
 	return parser.parse_args()
 
 
@@ -46,15 +57,21 @@ async def main():
 	load_dotenv()
 
 	# Validate required env vars
-	require_env(["OPENAI_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX", "TAVILY_API_KEY"])
+	require_env([*providers.required_env(), "TAVILY_API_KEY"])
 
 	args = parse_args()
 	await run_pipeline(
 		args.url,
 		max_depth=args.max_depth,
 		extract_depth=args.extract_depth,
+		rebuild=args.rebuild,
 	)
 
+	if args.faq:
+		from batch import prewarm, read_queries
+
+		await prewarm(read_queries(args.faq), [args.url])
+
 
 if __name__ == "__main__":
 	asyncio.run(main())
@@ -0,0 +1,52 @@
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Named sets of namespaces a chat request can query together, e.g. a
+# product's docs, blog and knowledge base. NAMESPACE_GROUPS is a JSON object
+# mapping group names to lists of namespaces, given inline or as the path
+# of a JSON file.
+NAMESPACE_GROUPS = os.getenv("NAMESPACE_GROUPS", "")
+
+
+@lru_cache(maxsize=1)
+def namespace_groups() -> Dict[str, List[str]]:
+    raw = NAMESPACE_GROUPS.strip()
+    if not raw:
+        return {}
+    if not raw.startswith("{"):
+        raw = Path(raw).read_text()
+
+    groups = json.loads(raw)
+    logger.info("Namespace groups loaded", extra={"groups": sorted(groups)})
+    return {name: list(members) for name, members in groups.items()}
+
+
+def resolve_namespaces(
+    namespace: Optional[str] = None,
+    namespaces: Optional[List[str]] = None,
+    group: Optional[str] = None,
+) -> List[str]:
+    """Namespaces to search, in request order and without duplicates.
+
+    Raises ValueError for an unknown group or when nothing is selected.
+    """
+    selected: List[str] = []
+    if namespace:
+        selected.append(namespace)
+    selected.extend(namespaces or [])
+    if group:
+        members = namespace_groups().get(group)
+        if members is None:
+            raise ValueError(f"Unknown namespace group: {group}")
+        selected.extend(members)
+
+    selected = list(dict.fromkeys(ns for ns in selected if ns))
+    if not selected:
+        raise ValueError("Missing namespace")
+    return selected
@@ -1,6 +1,25 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Dict, Literal, Set, TypedDict
+from uuid import uuid4
+
 from langgraph.graph import StateGraph, END
-from langgraph.types import interrupt
-from typing import TypedDict, Literal
+from langgraph.types import Command, interrupt
+
+logger = logging.getLogger(__name__)
+
+# Orders are checkpointed to SQLite, so an order waiting for approval is a
+# row in ORDER_DB and nothing else: no task, no coroutine, no memory. A run
+# goes until the approval interrupt (or the end) and exits; a decision
+# starts a new run that resumes from the checkpoint.
+ORDER_DB = os.getenv("ORDER_DB", "orders.sqlite")
+
+# Events a subscriber may fall behind before it is dropped (its stream ends
+# and the client resubscribes).
+ORDER_SUBSCRIBER_QUEUE = int(os.getenv("ORDER_SUBSCRIBER_QUEUE", "100"))
 
 
 class OrderState(TypedDict):
@@ -10,11 +29,11 @@ class OrderState(TypedDict):
     status: str
 
 
-def validate_order(state: OrderState):
+async def validate_order(state: OrderState):
     return {**state, "status": "validated"}
 
 
-def request_approval(state: OrderState):
+async def request_approval(state: OrderState):
     decision = interrupt(
         {
             "type": "order_approval",
@@ -26,7 +45,7 @@ def request_approval(state: OrderState):
     return {**state, "approved": decision == "approve"}
 
 
-def finalize_order(state: OrderState):
+async def finalize_order(state: OrderState):
     if state["approved"]:
         return {**state, "status": "order_confirmed"}
     return {**state, "status": "order_cancelled"}
@@ -42,4 +61,188 @@ graph.add_edge("validate", "approve")
 graph.add_edge("approve", "finalize")
 graph.add_edge("finalize", END)
 
-order_app = graph.compile()
+
+class OrderNotFound(Exception):
+    pass
+
+
+class OrderConflict(Exception):
+    """The order is running or not waiting for a decision."""
+
+
+class OrderEvents:
+    """In-process fan-out of order events to any number of subscribers.
+
+    Each order's graph run publishes once; every subscriber gets its own
+    bounded queue. A subscriber that falls ORDER_SUBSCRIBER_QUEUE events
+    behind is dropped and receives None.
+    """
+
+    def __init__(self, queue_size: int = ORDER_SUBSCRIBER_QUEUE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def publish(self, order_id: str, event: Dict[str, Any]) -> None:
+        subscribers = self._subscribers.get(order_id)
+        if not subscribers:
+            return
+        for queue in list(subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                logger.warning(
+                    "Order subscriber dropped", extra={"order_id": order_id}
+                )
+
+    @asynccontextmanager
+    async def subscribe(self, order_id: str):
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers[order_id].add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(order_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[order_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+
+class OrderService:
+    def __init__(self, db_path: str = ORDER_DB):
+        self.db_path = db_path
+        self.events = OrderEvents()
+        self.app = None
+        self._stack = AsyncExitStack()
+        # Only orders with a graph run in flight.
+        self._runs: Dict[str, asyncio.Task] = {}
+
+    async def open(self) -> None:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        checkpointer = await self._stack.enter_async_context(
+            AsyncSqliteSaver.from_conn_string(self.db_path)
+        )
+        # WAL keeps checkpoint writes cheap with thousands of orders.
+        await checkpointer.conn.execute("PRAGMA journal_mode=WAL")
+        await checkpointer.conn.execute("PRAGMA synchronous=NORMAL")
+        await checkpointer.setup()
+        self.app = graph.compile(checkpointer=checkpointer)
+        logger.info("Order service opened", extra={"db": self.db_path})
+
+    async def close(self) -> None:
+        if self._runs:
+            # Runs end at the next interrupt or the end of the graph.
+            await asyncio.wait(list(self._runs.values()), timeout=10)
+        await self._stack.aclose()
+
+    async def start(self, item: str, quantity: int) -> str:
+        order_id = str(uuid4())
+        self._launch(
+            order_id,
+            {"item": item, "quantity": quantity, "approved": None, "status": "started"},
+        )
+        return order_id
+
+    async def state(self, order_id: str) -> Dict[str, Any]:
+        snapshot = await self.app.aget_state(self._config(order_id))
+        if not snapshot.values:
+            if order_id in self._runs:
+                # Started, first checkpoint not written yet.
+                return {
+                    "order_id": order_id,
+                    "status": "started",
+                    "running": True,
+                }
+            raise OrderNotFound(order_id)
+
+        pending = [i.value for task in snapshot.tasks for i in task.interrupts]
+        return {
+            "order_id": order_id,
+            **snapshot.values,
+            "running": order_id in self._runs,
+            "approval": pending[0] if pending else None,
+            "done": not snapshot.next,
+        }
+
+    async def decide(
+        self, order_id: str, decision: Literal["approve", "reject"]
+    ) -> None:
+        state = await self.state(order_id)
+        # No await between this check and the launch, so two decisions for
+        # the same order cannot both resume it.
+        if order_id in self._runs or state.get("approval") is None:
+            raise OrderConflict("Order is not waiting for approval")
+        self._launch(order_id, Command(resume=decision))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": len(self._runs),
+            "subscribers": self.events.subscriber_count(),
+        }
+
+    @staticmethod
+    def _config(order_id: str) -> Dict:
+        return {"configurable": {"thread_id": order_id}}
+
+    def _launch(self, order_id: str, payload: Any) -> None:
+        task = asyncio.create_task(self._run(order_id, payload))
+        self._runs[order_id] = task
+        task.add_done_callback(lambda _: self._runs.pop(order_id, None))
+
+    async def _run(self, order_id: str, payload: Any) -> None:
+        publish = self.events.publish
+        status = None
+        interrupted = False
+        try:
+            # One checkpoint per run, at the interrupt or the end. A run that
+            # dies midway leaves the order at its previous checkpoint, where
+            # the decision can simply be sent again.
+            async for chunk in self.app.astream(
+                payload,
+                self._config(order_id),
+                stream_mode="updates",
+                durability="exit",
+            ):
+                for node, update in chunk.items():
+                    if node == "__interrupt__":
+                        interrupted = True
+                        for item in update:
+                            publish(
+                                order_id,
+                                {
+                                    "event": "interrupt",
+                                    "order_id": order_id,
+                                    "value": item.value,
+                                },
+                            )
+                        continue
+                    status = update.get("status", status)
+                    publish(
+                        order_id,
+                        {
+                            "event": "update",
+                            "order_id": order_id,
+                            "node": node,
+                            "status": status,
+                        },
+                    )
+        except Exception as e:
+            logger.exception("Order run failed", extra={"order_id": order_id})
+            publish(order_id, {"event": "error", "order_id": order_id, "error": str(e)})
+            return
+
+        if not interrupted:
+            publish(
+                order_id, {"event": "done", "order_id": order_id, "status": status}
+            )
+            logger.info(
+                "Order completed", extra={"order_id": order_id, "status": status}
+            )
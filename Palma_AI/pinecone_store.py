@@ -0,0 +1,98 @@
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_pinecone import PineconeVectorStore
+
+import providers
+from executors import run_chat, run_ingest
+
+
+class PineconeStore(PineconeVectorStore):
+    """PineconeVectorStore that can also return the matched vectors.
+
+    MMR selection in the query graph needs the candidates' vectors; asking
+    Pinecone for them in the same query avoids re-embedding the chunks.
+
+    The async methods go through the process-wide asyncio index rather than
+    opening an HTTP session per call as the base class does.
+    """
+
+    def upsert_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        # Pinecone upserts by id, so re-adding a chunk id replaces it.
+        return self.add_documents(documents, **kwargs)
+
+    def similarity_search_with_vectors(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float, Optional[List[float]]]]:
+        results = self.index.query(
+            vector=embedding,
+            top_k=k,
+            include_values=True,
+            include_metadata=True,
+            namespace=kwargs.get("namespace") or self._namespace,
+            filter=kwargs.get("filter"),
+        )
+        return self._matches(results)
+
+    async def asimilarity_search_with_vectors(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float, Optional[List[float]]]]:
+        index = await providers.get_async_pinecone_index()
+        if index is None:
+            return await run_chat(
+                self.similarity_search_with_vectors, embedding, k, **kwargs
+            )
+
+        results = await index.query(
+            vector=embedding,
+            top_k=k,
+            include_values=True,
+            include_metadata=True,
+            namespace=kwargs.get("namespace") or self._namespace,
+            filter=kwargs.get("filter"),
+        )
+        return self._matches(results)
+
+    async def aupsert_documents(
+        self,
+        documents: List[Document],
+        *,
+        ids: List[str],
+        namespace: Optional[str] = None,
+    ) -> List[str]:
+        index = await providers.get_async_pinecone_index()
+        if index is None:
+            return await run_ingest(
+                self.upsert_documents, documents, ids=ids, namespace=namespace
+            )
+
+        texts = [doc.page_content for doc in documents]
+        vectors = await self._embedding.aembed_documents(texts)
+        records = [
+            (vector_id, vector, {**doc.metadata, self._text_key: doc.page_content})
+            for vector_id, vector, doc in zip(ids, vectors, documents)
+        ]
+        # Callers batch (see injestion.apply_delta); one request per call.
+        await index.upsert(vectors=records, namespace=namespace or self._namespace)
+        return ids
+
+    async def adelete(
+        self, ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> Optional[bool]:
+        index = await providers.get_async_pinecone_index()
+        if index is None:
+            return await run_ingest(self.delete, ids=ids, **kwargs)
+
+        await index.delete(ids=ids, namespace=kwargs.get("namespace") or self._namespace)
+        return True
+
+    def _matches(self, results) -> List[Tuple[Document, float, Optional[List[float]]]]:
+        matches = []
+        for match in results["matches"]:
+            metadata = dict(match["metadata"] or {})
+            text = metadata.pop(self._text_key, None)
+            if text is None:
+                continue
+            doc = Document(id=match.get("id"), page_content=text, metadata=metadata)
+            matches.append((doc, match["score"], match.get("values") or None))
+        return matches
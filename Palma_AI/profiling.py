@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Requests slower than SLOW_REQUEST_SECONDS are kept, with their per-node
+# timings, in a buffer of the last SLOW_REQUEST_BUFFER such requests.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_REQUEST_BUFFER = int(os.getenv("SLOW_REQUEST_BUFFER", "50"))
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+
+class Trace:
+    def __init__(self, kind: str, fields: Dict[str, Any]):
+        self.kind = kind
+        self.fields = fields
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.nodes: List[Dict[str, Any]] = []
+
+    def as_dict(self, elapsed: float, status: str) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "status": status,
+            **self.fields,
+            "nodes": self.nodes,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_BUFFER)
+
+
+@asynccontextmanager
+async def trace(kind: str, **fields: Any):
+    """Time a request and the graph nodes it runs (see `timed_node`).
+
+    Graph runs started inside the block, including shared (coalesced) runs
+    it starts, report their nodes to it through a context variable.
+    """
+    current = Trace(kind, fields)
+    token = _current.set(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - current.start
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            slow_requests.append(current.as_dict(elapsed, status))
+
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """Wrap an async graph node so its duration lands in the active trace."""
+
+    @functools.wraps(fn)
+    async def node(*args, **kwargs):
+        current = _current.get()
+        if current is None:
+            return await fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            current.nodes.append(
+                {
+                    "node": name,
+                    "start_ms": round((start - current.start) * 1000, 1),
+                    "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+                }
+            )
+
+    return node
+
+
+def slowest(kind: Optional[str] = None, limit: int = SLOW_REQUEST_BUFFER) -> List[Dict]:
+    found = [r for r in slow_requests if kind is None or r["kind"] == kind]
+    found.sort(key=lambda r: r["elapsed_ms"], reverse=True)
+    return found[:limit]
+
+
+_profiling = threading.Lock()
+
+
+def _stack(frame, thread_name: str) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def _sample(seconds: float, interval: float) -> Counter:
+    counts: Counter = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                counts[_stack(frame, names.get(ident, str(ident)))] += 1
+    return counts
+
+
+async def profile(seconds: float, interval: float = 0.005) -> str:
+    """Sample every thread's stack for `seconds` and return folded stacks
+    ("thread;frame;frame count" per line), the input format of
+    flamegraph.pl, speedscope and inferno.
+
+    Sampling runs on its own thread, not an executor's; one profile at a
+    time.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def settle(outcome, value) -> None:
+        if not done.done():
+            outcome(value)
+
+    def run():
+        # The lock is held until sampling ends, even if the caller left.
+        try:
+            counts = _sample(min(seconds, PROFILE_MAX_SECONDS), interval)
+            outcome = (done.set_result, counts)
+        except Exception as e:
+            outcome = (done.set_exception, e)
+        finally:
+            _profiling.release()
+        loop.call_soon_threadsafe(settle, *outcome)
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    counts = await done
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
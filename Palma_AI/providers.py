@@ -0,0 +1,265 @@
+import asyncio
+import os
+import logging
+import weakref
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+# cspell ignore tavily
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Factories registered through `use()` replace the real OpenAI / Pinecone /
+# Tavily clients for the whole process (see fakes.py and benchmark.py).
+_overrides: Dict[str, Callable[..., Any]] = {}
+
+# Hard cap on a single OpenAI HTTP call; the per-stage budgets in deadline.py
+# are normally tighter. Without it the client waits up to ten minutes.
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+
+# "pinecone" (default) or "local" for the memory-mapped index in localindex.py.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+
+# Matryoshka-style truncation done by the embedding model itself
+# (text-embedding-3 supports it); must match the Pinecone index dimension.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+# Connection pool shared by the async OpenAI clients (chat and embeddings).
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# Directory of the shared query-embedding snapshot (see embedcache.py).
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR")
+
+# The client libraries are imported on first use and the clients are built
+# once per process: a chat-only worker never loads Tavily, and nothing pays
+# for client construction (or Pinecone's host lookup) on every request.
+
+
+def use(**factories: Callable[..., Any]) -> None:
+    unknown = set(factories) - {
+        "embeddings",
+        "chat_model",
+        "vector_store",
+        "pinecone_index",
+        "crawler",
+        "extractor",
+    }
+    if unknown:
+        raise ValueError(f"Unknown provider(s): {', '.join(sorted(unknown))}")
+
+    logger.info("Provider overrides installed", extra={"providers": sorted(factories)})
+    _overrides.update(factories)
+
+
+def reset() -> None:
+    _overrides.clear()
+    for cached in (
+        _embeddings,
+        _chat_model,
+        _pinecone_index,
+        _vector_store,
+        _crawler,
+        _extractor,
+        _http_client,
+    ):
+        cached.cache_clear()
+    _async_indexes.clear()
+
+
+@lru_cache(maxsize=1)
+def _http_client():
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+        timeout=OPENAI_TIMEOUT_SECONDS,
+    )
+
+
+@lru_cache(maxsize=1)
+def _embeddings() -> Embeddings:
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        dimensions=EMBEDDING_DIMENSIONS,
+        request_timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=1,
+        http_async_client=_http_client(),
+    )
+    if EMBED_CACHE_DIR:
+        from embedcache import EmbeddingCache
+
+        return EmbeddingCache(embeddings, EMBED_CACHE_DIR)
+    return embeddings
+
+
+@lru_cache(maxsize=1)
+def _chat_model() -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model="gpt-4.1-mini",
+        temperature=0.2,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=1,
+        http_async_client=_http_client(),
+    )
+
+
+@lru_cache(maxsize=1)
+def _pinecone_index():
+    if VECTOR_BACKEND == "local":
+        from localindex import LocalSignatureIndex
+
+        return LocalSignatureIndex(LOCAL_INDEX_DIR, get_embeddings())
+
+    try:
+        from pinecone import Pinecone as PineconeClient
+    except Exception:
+        import pinecone as pinecone_v7
+
+        pinecone_v7.init(api_key=os.environ["PINECONE_API_KEY"])
+        return pinecone_v7.Index(os.environ["PINECONE_INDEX"])
+
+    pinecone_client = PineconeClient(api_key=os.environ["PINECONE_API_KEY"])
+    return pinecone_client.Index(os.environ["PINECONE_INDEX"])
+
+
+# One asyncio index (and its HTTP session) per event loop; sessions cannot
+# be shared across loops.
+_async_indexes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def _async_pinecone_index():
+    loop = asyncio.get_running_loop()
+    index = _async_indexes.get(loop)
+    if index is None:
+        from pinecone import PineconeAsyncio
+
+        async with PineconeAsyncio(api_key=os.environ["PINECONE_API_KEY"]) as client:
+            # The host comes from the sync client's (cached) index lookup.
+            index = client.IndexAsyncio(host=_pinecone_index().config.host)
+        _async_indexes[loop] = index
+    return index
+
+
+@lru_cache(maxsize=256)
+def _vector_store(namespace: str) -> VectorStore:
+    if VECTOR_BACKEND == "local":
+        from localindex import LocalIndexStore
+
+        return LocalIndexStore(LOCAL_INDEX_DIR, namespace, get_embeddings())
+
+    from pinecone_store import PineconeStore
+
+    return PineconeStore(
+        index=_pinecone_index(),
+        embedding=get_embeddings(),
+        namespace=namespace,
+    )
+
+
+@lru_cache(maxsize=1)
+def _crawler():
+    from langchain_tavily import TavilyCrawl as SearchCrawler
+
+    return SearchCrawler()
+
+
+@lru_cache(maxsize=1)
+def _extractor():
+    from langchain_tavily import TavilyExtract
+
+    return TavilyExtract()
+
+
+def required_env() -> List[str]:
+    """Environment variables the configured model and vector backend need."""
+    keys = ["OPENAI_API_KEY"]
+    if VECTOR_BACKEND == "pinecone":
+        keys += ["PINECONE_API_KEY", "PINECONE_INDEX"]
+    return keys
+
+
+def get_embeddings() -> Embeddings:
+    if "embeddings" in _overrides:
+        return _overrides["embeddings"]()
+    return _embeddings()
+
+
+def get_chat_model() -> BaseChatModel:
+    if "chat_model" in _overrides:
+        return _overrides["chat_model"]()
+    return _chat_model()
+
+
+def get_vector_store(namespace: str) -> VectorStore:
+    if "vector_store" in _overrides:
+        return _overrides["vector_store"](namespace)
+    return _vector_store(namespace)
+
+
+def get_pinecone_index():
+    if "pinecone_index" in _overrides:
+        return _overrides["pinecone_index"]()
+    return _pinecone_index()
+
+
+async def get_async_pinecone_index() -> Optional[Any]:
+    """The shared asyncio Pinecone index, or None when Pinecone is not in use
+    (local backend or an overridden index)."""
+    if VECTOR_BACKEND == "local" or "pinecone_index" in _overrides:
+        return None
+    return await _async_pinecone_index()
+
+
+def get_crawler():
+    if "crawler" in _overrides:
+        return _overrides["crawler"]()
+    return _crawler()
+
+
+def get_extractor():
+    if "extractor" in _overrides:
+        return _overrides["extractor"]()
+    return _extractor()
+
+
+def warmup() -> None:
+    """Build the clients used on the chat path so the first request does not."""
+    get_embeddings()
+    get_chat_model()
+    if "vector_store" in _overrides:
+        return
+
+    if VECTOR_BACKEND == "local":
+        from localindex import list_namespaces
+
+        # Maps every namespace up front; the pages themselves are shared
+        # with the other workers through the page cache.
+        for namespace in list_namespaces(LOCAL_INDEX_DIR):
+            get_vector_store(namespace).index
+    else:
+        get_pinecone_index()
+        import pinecone_store  # noqa: F401
+
+
+async def aclose() -> None:
+    """Close the shared async HTTP sessions opened on the running loop."""
+    index = _async_indexes.pop(asyncio.get_running_loop(), None)
+    if index is not None:
+        await index.close()
+    if _http_client.cache_info().currsize:
+        await _http_client().aclose()
+        _http_client.cache_clear()
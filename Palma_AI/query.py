@@ -1,9 +1,13 @@
 import asyncio
-import os
 import logging
-from typing import TypedDict, List, Annotated
+from functools import lru_cache
+from itertools import zip_longest
+from typing import TypedDict, List, Dict, Tuple, Annotated, NotRequired
+
+import numpy as np
 
 from langgraph.graph import StateGraph
+from langgraph.channels.untracked_value import UntrackedValue
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.message import add_messages
 
@@ -12,11 +16,26 @@ from langchain_core.messages import (
     BaseMessage,
     SystemMessage,
     HumanMessage,
+    AIMessage,
 )
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
 
+import aliases
+import docstore
+import providers
+from deadline import get_deadline, stage_timeout
+from executors import run_chat
+from fallback import RetrievalFallback
+from profiling import timed_node
+from rerank import (
+    CONTEXT_MAX_CHARS,
+    RETRIEVE_CANDIDATES,
+    get_scorer,
+    minmax,
+    select_within_budget,
+)
+
 # from langchain_ollama import ChatOllama
 
 
@@ -31,15 +50,44 @@ load_dotenv()
 
 
 class QueryState(TypedDict):
+    # Checkpointed per thread: the conversation and the outcome of the last
+    # turn. `messages` holds the bare questions and answers, the context
+    # block is only ever part of the prompt.
     query: str
     namespace: str
     messages: Annotated[List[BaseMessage], add_messages]
-    retrieved_docs: List[Document]
-    context: str
     answer: str
+    sources: List[Dict[str, str]]
+    degraded: NotRequired[str]
+
+    # Working data of the current run, never checkpointed.
+    retrieved_docs: Annotated[List[Document], UntrackedValue(list)]
+    candidate_scores: NotRequired[Annotated[List[float], UntrackedValue(list)]]
+    candidate_vectors: NotRequired[Annotated[List, UntrackedValue(list)]]
+    context: Annotated[str, UntrackedValue(str)]
+    deadline: NotRequired[Annotated[float, UntrackedValue(float)]]
+    # Precomputed by batch runs (see batch.py) so retrieve skips the embed.
+    query_embedding: NotRequired[Annotated[List[float], UntrackedValue(list)]]
+    # Set for multi-namespace queries; `namespace` then holds them joined.
+    namespaces: NotRequired[Annotated[List[str], UntrackedValue(list)]]
+
+
+PERSISTED_KEYS = ("query", "namespace", "messages", "answer", "sources", "degraded")
+
+
+def persisted(state: QueryState) -> Dict:
+    return {k: state[k] for k in PERSISTED_KEYS if k in state}
 
 
-def build_context(docs: List[Document], max_chars: int = 4000) -> str:
+# Serves recent results when the embedding or search stage misses its budget.
+retrieval_fallback = RetrievalFallback()
+
+FALLBACK_ANSWER = (
+    "I could not produce an answer in time. Please try again in a moment."
+)
+
+
+def build_context(docs: List[Document], max_chars: int = CONTEXT_MAX_CHARS) -> str:
     logger.info(
         "Building context",
         extra={"documents": len(docs), "max_chars": max_chars},
@@ -65,34 +113,245 @@ def build_context(docs: List[Document], max_chars: int = 4000) -> str:
     return "\n\n---\n\n".join(parts)
 
 
-async def retrieve(state: QueryState) -> QueryState:
+def search_with_vectors(
+    vector_store, embedding: List[float], k: int
+) -> List[Tuple[Document, float, object]]:
+    """Top-k matches with scores and, where the store can return them, vectors."""
+    search = getattr(vector_store, "similarity_search_with_vectors", None)
+    if search is not None:
+        return search(embedding, k)
+    return [
+        (doc, score, None)
+        for doc, score in vector_store.similarity_search_with_score_by_vector(
+            embedding, k
+        )
+    ]
+
+
+async def asearch_with_vectors(
+    vector_store, embedding: List[float], k: int
+) -> List[Tuple[Document, float, object]]:
+    """search_with_vectors without a thread where the store has an async
+    client; otherwise on the chat executor."""
+    search = getattr(vector_store, "asimilarity_search_with_vectors", None)
+    if search is not None:
+        return await search(embedding, k)
+    return await run_chat(search_with_vectors, vector_store, embedding, k)
+
+
+def merge_by_score(
+    shards: List[List[Tuple[Document, float, object]]], k: int
+) -> List[Tuple[Document, float, object]]:
+    """Merge per-namespace results into one top-k list.
+
+    Raw scores are not comparable across indexes of different size and
+    content, so each shard's scores are min-max normalised first.
+    """
+    merged = []
+    for results in shards:
+        if not results:
+            continue
+        normalised = minmax(np.asarray([score for _, score, _ in results]))
+        merged.extend(
+            (doc, float(norm), vector, score)
+            for (doc, score, vector), norm in zip(results, normalised)
+        )
+
+    merged.sort(key=lambda item: (item[1], item[3]), reverse=True)
+    return [(doc, norm, vector) for doc, norm, vector, _ in merged[:k]]
+
+
+async def search_namespaces(
+    namespaces: List[str],
+    query: str,
+    embedding: List[float],
+    k: int,
+    deadline,
+) -> Tuple[List[Tuple[Document, float, object]], List[str]]:
+    """Search every namespace concurrently with the same query embedding.
+
+    Returns the merged results and the namespaces that failed or timed out.
+    A single namespace keeps its raw scores and its errors propagate; with
+    several, each gets the shard budget and only a total failure raises.
+    Namespaces are logical names, searched in the version their alias
+    points at.
+    """
+    if len(namespaces) == 1:
+        vector_store = providers.get_vector_store(aliases.resolve(namespaces[0]))
+        results = await asyncio.wait_for(
+            asearch_with_vectors(vector_store, embedding, k),
+            stage_timeout("search", deadline),
+        )
+        retrieval_fallback.remember(
+            namespaces[0], query, [doc for doc, _, _ in results]
+        )
+        return results, []
+
+    timeout = min(stage_timeout("shard", deadline), stage_timeout("search", deadline))
+
+    async def search(namespace: str):
+        vector_store = providers.get_vector_store(aliases.resolve(namespace))
+        return await asyncio.wait_for(
+            asearch_with_vectors(vector_store, embedding, k),
+            timeout,
+        )
+
+    outcomes = await asyncio.gather(
+        *(search(ns) for ns in namespaces), return_exceptions=True
+    )
+
+    shards, missed = [], []
+    for namespace, outcome in zip(namespaces, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.warning(
+                "Namespace search failed",
+                extra={"namespace": namespace, "error": type(outcome).__name__},
+            )
+            missed.append(namespace)
+            continue
+        shards.append(outcome)
+        retrieval_fallback.remember(namespace, query, [doc for doc, _, _ in outcome])
+
+    if not shards:
+        raise next(o for o in outcomes if isinstance(o, BaseException))
+    return merge_by_score(shards, k), missed
+
+
+def fallback_lookup(
+    namespaces: List[str], query: str, k: int
+) -> Tuple[List[Document], str]:
+    found, sources = [], []
+    for namespace in namespaces:
+        try:
+            store = providers.get_vector_store(aliases.resolve(namespace))
+        except Exception:
+            store = None
+        docs, source = retrieval_fallback.lookup(namespace, query, k, store=store)
+        found.append(docs)
+        sources.append(source)
+
+    # Interleave so every namespace is represented in the first k.
+    docs = [d for group in zip_longest(*found) for d in group if d is not None]
+    source = sources[0] if len(set(sources)) == 1 else "mixed"
+    return docs[:k], source
+
+
+async def retrieve(state: QueryState, config: RunnableConfig) -> QueryState:
+    namespaces = state.get("namespaces") or [state["namespace"]]
     logger.info(
         "Retrieve node started",
         extra={
             "query": state["query"],
-            "namespace": state["namespace"],
+            "namespaces": namespaces,
         },
     )
 
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    vector_store = PineconeVectorStore.from_existing_index(
-        index_name=os.environ["PINECONE_INDEX"],
-        embedding=embeddings,
-        namespace=state["namespace"],
+    deadline = get_deadline(state, config)
+    # Over-fetch; the rerank node picks what goes into the context.
+    k = RETRIEVE_CANDIDATES
+
+    try:
+        # One embedding serves every namespace.
+        embedding = state.get("query_embedding") or await asyncio.wait_for(
+            providers.get_embeddings().aembed_query(state["query"]),
+            stage_timeout("embed", deadline),
+        )
+        results, missed = await search_namespaces(
+            namespaces, state["query"], embedding, k, deadline
+        )
+    except Exception as e:
+        docs, source = fallback_lookup(namespaces, state["query"], k)
+        logger.warning(
+            "Retrieve degraded",
+            extra={
+                "error": type(e).__name__,
+                "fallback": source,
+                "documents": len(docs),
+            },
+        )
+        return {
+            "retrieved_docs": docs,
+            "candidate_scores": [],
+            "candidate_vectors": [],
+            "degraded": f"retrieval:{source}",
+        }
+
+    docs = [doc for doc, _, _ in results]
+
+    logger.info(
+        "Retrieve node completed",
+        extra={"documents": len(docs), "missed_namespaces": missed},
+    )
+
+    return {
+        "retrieved_docs": docs,
+        "candidate_scores": [score for _, score, _ in results],
+        "candidate_vectors": [vector for _, _, vector in results],
+        # Partial: answered without the namespaces that missed their budget.
+        "degraded": "retrieval:partial" if missed else "",
+    }
+
+
+async def rerank(state: QueryState) -> QueryState:
+    docs = state["retrieved_docs"]
+    logger.info("Rerank node started", extra={"candidates": len(docs)})
+    if not docs:
+        return {"retrieved_docs": []}
+
+    vector_scores = np.asarray(state.get("candidate_scores") or [], dtype=np.float32)
+    if len(vector_scores) != len(docs):
+        # Fallback results come without scores; keep their order as a prior.
+        vector_scores = np.linspace(1.0, 0.0, len(docs), dtype=np.float32)
+
+    scorer = get_scorer()
+    if scorer.blocking:
+        scores = await run_chat(scorer.score, state["query"], docs, vector_scores)
+    else:
+        scores = scorer.score(state["query"], docs, vector_scores)
+
+    vectors = state.get("candidate_vectors") or []
+    if len(vectors) == len(docs) and all(v is not None for v in vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+    else:
+        vectors = None
+
+    # MMR over the reranked candidates, so adjacent overlapping slices of one
+    # page do not crowd out other pages.
+    selected = select_within_budget(docs, scores, vectors)
+
+    logger.info(
+        "Rerank node completed",
+        extra={"selected": len(selected), "scorer": type(scorer).__name__},
     )
 
-    docs = await asyncio.to_thread(
-        vector_store.similarity_search,
-        state["query"],
-        6,
+    return {"retrieved_docs": selected}
+
+
+async def expand(state: QueryState) -> QueryState:
+    docs = state["retrieved_docs"]
+    if not docs or docstore.PARENT_SPAN_CHARS <= 0:
+        return {"retrieved_docs": docs}
+
+    # Small-to-big: the chunks matched, their sections or pages (read from
+    # the local docstore) go into the context.
+    namespaces = state.get("namespaces") or [state["namespace"]]
+    expanded = await run_chat(
+        docstore.expand_documents,
+        docs,
+        [aliases.resolve(ns) for ns in namespaces],
+        max_chars=CONTEXT_MAX_CHARS,
     )
 
     logger.info(
-        "Retrieve node completed",
-        extra={"documents": len(docs)},
+        "Expand node completed",
+        extra={
+            "documents": len(expanded),
+            "chunk_chars": sum(len(d.page_content) for d in docs),
+            "expanded_chars": sum(len(d.page_content) for d in expanded),
+        },
     )
 
-    return {**state, "retrieved_docs": docs}
+    return {"retrieved_docs": expanded}
 
 
 async def assemble_context(state: QueryState) -> QueryState:
@@ -108,10 +367,10 @@ async def assemble_context(state: QueryState) -> QueryState:
         extra={"context_length": len(context)},
     )
 
-    return {**state, "context": context}
+    return {"context": context}
 
 
-async def generate(state: QueryState) -> QueryState:
+async def generate(state: QueryState, config: RunnableConfig) -> QueryState:
     logger.info(
         "Generate node started",
         extra={
@@ -120,7 +379,7 @@ async def generate(state: QueryState) -> QueryState:
         },
     )
 
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.2)
+    llm = providers.get_chat_model()
     # llm = ChatOllama(model="llama3.2:latest", temperature=0.2)
 
     system = SystemMessage(
@@ -132,34 +391,82 @@ async def generate(state: QueryState) -> QueryState:
         )
     )
 
-    human = HumanMessage(
+    prompt = HumanMessage(
         content=f"Question:\n{state['query']}\n\nContext:\n{state['context']}"
     )
 
-    response = await llm.ainvoke([system, *state["messages"], human])
+    # Stream so that whatever arrived before the budget ran out can still be
+    # returned as a partial answer.
+    parts: List[str] = []
+    degraded = state.get("degraded", "")
+    try:
+        async with asyncio.timeout(
+            stage_timeout("generate", get_deadline(state, config))
+        ):
+            async for chunk in llm.astream([system, *state["messages"], prompt]):
+                parts.append(chunk.text)
+    except TimeoutError:
+        degraded = "generation:partial" if any(parts) else "generation:fallback"
+        logger.warning(
+            "Generate node timed out",
+            extra={"partial_length": sum(len(p) for p in parts)},
+        )
+
+    answer = "".join(parts)
+    if degraded == "generation:partial":
+        answer += " [answer truncated: time limit reached]"
+    elif degraded == "generation:fallback":
+        answer = FALLBACK_ANSWER
+    response = AIMessage(content=answer)
 
     logger.info(
         "Generate node completed",
-        extra={"answer_length": len(response.content)},
+        extra={"answer_length": len(answer)},
     )
 
     return {
-        **state,
-        "messages": [human, response],
-        "answer": response.content,
+        "messages": [HumanMessage(content=state["query"]), response],
+        "answer": answer,
+        "sources": [
+            {
+                "source": d.metadata.get("source", ""),
+                "chunk_id": d.metadata.get("chunk_id", ""),
+            }
+            for d in state["retrieved_docs"]
+        ],
+        "degraded": degraded,
     }
 
 
-checkpointer = MemorySaver()
-graph = StateGraph(QueryState)
+def build_query_app():
+    graph = StateGraph(QueryState)
+
+    graph.add_node("retrieve", timed_node("retrieve", retrieve))
+    graph.add_node("rerank", timed_node("rerank", rerank))
+    graph.add_node("expand", timed_node("expand", expand))
+    graph.add_node(
+        "assemble_context", timed_node("assemble_context", assemble_context)
+    )
+    graph.add_node("generate", timed_node("generate", generate))
+
+    graph.set_entry_point("retrieve")
+    graph.add_edge("retrieve", "rerank")
+    graph.add_edge("rerank", "expand")
+    graph.add_edge("expand", "assemble_context")
+    graph.add_edge("assemble_context", "generate")
+    graph.set_finish_point("generate")
+
+    return graph.compile(checkpointer=MemorySaver())
+
 
-graph.add_node("retrieve", retrieve)
-graph.add_node("assemble_context", assemble_context)
-graph.add_node("generate", generate)
+@lru_cache(maxsize=1)
+def get_query_app():
+    # Compiled on first use (normally the server's startup step) rather than
+    # at import, so importing this module stays cheap.
+    return build_query_app()
 
-graph.set_entry_point("retrieve")
-graph.add_edge("retrieve", "assemble_context")
-graph.add_edge("assemble_context", "generate")
-graph.set_finish_point("generate")
 
-query_app = graph.compile(checkpointer=checkpointer)
\ No newline at end of file
+def __getattr__(name: str):
+    if name == "query_app":
+        return get_query_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from injestion import checksum, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Scheduled recrawls. Each registered site gets a full crawl every
+# RECRAWL_DISCOVERY_HOURS to pick up new and removed pages; in between, known
+# pages are fetched individually when due. A page's interval halves each
+# time its checksum changed since the last fetch and grows by half each time
+# it did not, within [RECRAWL_MIN_INTERVAL_HOURS, RECRAWL_MAX_INTERVAL_HOURS].
+# At most RECRAWL_PAGES_PER_HOUR pages are fetched per rolling hour, most
+# overdue first; a full crawl is limited to the pages still allowed and
+# charged for the pages it fetched. While that is less than the known site,
+# each crawl cut short starts the next one from the page it reached last, so
+# successive crawls cover the whole site. A page the last full
+# crawl did not reach is removed once RECRAWL_REMOVE_AFTER_FAILURES fetches
+# of it in a row fail. State lives in one JSON file, RECRAWL_STATE.
+RECRAWL_STATE = os.getenv("RECRAWL_STATE", "recrawl_state.json")
+RECRAWL_PAGES_PER_HOUR = int(os.getenv("RECRAWL_PAGES_PER_HOUR", "200"))
+RECRAWL_MIN_INTERVAL = float(os.getenv("RECRAWL_MIN_INTERVAL_HOURS", "1")) * 3600
+RECRAWL_MAX_INTERVAL = float(os.getenv("RECRAWL_MAX_INTERVAL_HOURS", "168")) * 3600
+RECRAWL_INITIAL_INTERVAL = float(os.getenv("RECRAWL_INITIAL_INTERVAL_HOURS", "24")) * 3600
+RECRAWL_DISCOVERY_INTERVAL = float(os.getenv("RECRAWL_DISCOVERY_HOURS", "168")) * 3600
+RECRAWL_POLL_SECONDS = float(os.getenv("RECRAWL_POLL_SECONDS", "60"))
+RECRAWL_REMOVE_AFTER_FAILURES = int(os.getenv("RECRAWL_REMOVE_AFTER_FAILURES", "2"))
+
+HOUR = 3600.0
+
+
+class RecrawlScheduler:
+    def __init__(
+        self,
+        path: Path | str = RECRAWL_STATE,
+        *,
+        pages_per_hour: int = RECRAWL_PAGES_PER_HOUR,
+        min_interval: float = RECRAWL_MIN_INTERVAL,
+        max_interval: float = RECRAWL_MAX_INTERVAL,
+        initial_interval: float = RECRAWL_INITIAL_INTERVAL,
+        discovery_interval: float = RECRAWL_DISCOVERY_INTERVAL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = Path(path)
+        self.pages_per_hour = pages_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.discovery_interval = discovery_interval
+        self.clock = clock
+
+        self.state = {"sites": {}, "history": []}
+        if self.path.exists():
+            self.state = json.loads(self.path.read_text())
+
+    @property
+    def sites(self) -> Dict[str, Dict]:
+        return self.state["sites"]
+
+    def save(self) -> None:
+        staging = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        staging.write_text(json.dumps(self.state))
+        os.replace(staging, self.path)
+
+    def add_site(
+        self, url: str, *, max_depth: int = 5, extract_depth: str = "advanced"
+    ) -> None:
+        site = self.sites.setdefault(url, {"last_discovery": 0.0, "pages": {}})
+        site["max_depth"] = max_depth
+        site["extract_depth"] = extract_depth
+
+    def remove_site(self, url: str) -> None:
+        self.sites.pop(url, None)
+
+    def allowance(self, now: float) -> int:
+        # history holds [timestamp, pages] per fetch within the last hour.
+        history = [h for h in self.state["history"] if h[0] > now - HOUR]
+        self.state["history"] = history
+        return max(0, self.pages_per_hour - sum(pages for _, pages in history))
+
+    def plan(self, now: float) -> List[Tuple[str, Optional[List[str]], Optional[int]]]:
+        """(site, None, page limit) for a full crawl or (site, urls, None)
+        for due pages."""
+        allowance = self.allowance(now)
+        plan: List[Tuple[str, Optional[List[str]], Optional[int]]] = []
+
+        for url, site in self.sites.items():
+            if now - site["last_discovery"] < self.discovery_interval:
+                continue
+            # A known site waits until its size (at most a full budget) is
+            # allowed. The crawl may use everything left, so it is the last
+            # fetch this tick; it is charged only for the pages it fetched.
+            cost = min(max(len(site["pages"]), 1), self.pages_per_hour)
+            if cost <= allowance:
+                plan.append((url, None, allowance))
+                allowance = 0
+
+        discovering = {url for url, _, _ in plan}
+        due = []
+        for url, site in self.sites.items():
+            if url in discovering:
+                continue
+            for page_url, page in site["pages"].items():
+                overdue = (now - page["last_crawled"]) / page["interval"]
+                if overdue >= 1:
+                    due.append((overdue, url, page_url))
+
+        due.sort(reverse=True)
+        by_site: Dict[str, List[str]] = defaultdict(list)
+        for _, url, page_url in due[:allowance]:
+            by_site[url].append(page_url)
+        plan.extend((url, urls, None) for url, urls in by_site.items())
+        return plan
+
+    def discovery_start(self, url: str, limit: int) -> Optional[str]:
+        """Where a full crawl of `url` limited to `limit` pages starts: the
+        site root, unless the known site does not fit and the last full
+        crawl was cut short; then the page it reached last, so successive
+        crawls work outwards through the site."""
+        site = self.sites[url]
+        frontier = site.get("frontier")
+        if len(site["pages"]) < limit or frontier not in site["pages"]:
+            return None
+        return frontier
+
+    def unlisted(self, url: str, urls: List[str]) -> List[str]:
+        """The pages among `urls` to remove if this fetch of them fails too:
+        the last full crawl did not reach them and earlier fetches failed."""
+        site = self.sites[url]
+        pages = site["pages"]
+        return [
+            u
+            for u in urls
+            if u in pages
+            and pages[u].get("seen", 0.0) < site["last_discovery"]
+            and pages[u].get("failures", 0) + 1 >= RECRAWL_REMOVE_AFTER_FAILURES
+        ]
+
+    def record(
+        self,
+        url: str,
+        requested: Optional[List[str]],
+        fetched: Dict[str, str],
+        now: float,
+        *,
+        complete: bool = True,
+        removed: Iterable[str] = (),
+    ) -> int:
+        """Update page intervals from a crawl of `url`; returns pages changed.
+
+        A full crawl cut short by its page limit, or started from a page, is
+        not `complete`: pages it did not reach are kept, as they are in the
+        index. `removed` pages were dropped from the index.
+        """
+        site = self.sites[url]
+        pages = site["pages"]
+        changed = 0
+
+        removed = set(removed)
+        for page_url in removed:
+            pages.pop(page_url, None)
+
+        if requested is None:
+            site["last_discovery"] = now
+            if complete:
+                # The full sync removed these pages from the index too.
+                for page_url in set(pages) - set(fetched):
+                    del pages[page_url]
+
+        for page_url in requested or fetched:
+            if page_url in removed:
+                continue
+            page = pages.get(page_url)
+            new_checksum = fetched.get(page_url)
+            if page is None:
+                if new_checksum is not None:
+                    pages[page_url] = {
+                        "checksum": new_checksum,
+                        "interval": self.initial_interval,
+                        "last_crawled": now,
+                        "checks": 1,
+                        "changes": 0,
+                    }
+                    if requested is None:
+                        pages[page_url]["seen"] = now
+                continue
+
+            page["last_crawled"] = now
+            if new_checksum is None:
+                # Failed fetch; try again after the current interval.
+                page["failures"] = page.get("failures", 0) + 1
+                continue
+            page["failures"] = 0
+            if requested is None:
+                page["seen"] = now
+            page["checks"] += 1
+            if new_checksum != page["checksum"]:
+                page["changes"] += 1
+                page["interval"] = max(self.min_interval, page["interval"] / 2)
+                changed += 1
+            else:
+                page["interval"] = min(self.max_interval, page["interval"] * 1.5)
+            page["checksum"] = new_checksum
+
+        self.state["history"].append([now, len(requested or fetched) or 1])
+        return changed
+
+    async def tick(self) -> Dict[str, int]:
+        now = self.clock()
+        summary = {
+            "full_crawls": 0,
+            "pages": 0,
+            "changed": 0,
+            "removed": 0,
+            "failed": 0,
+        }
+
+        for url, urls, limit in self.plan(now):
+            site = self.sites[url]
+            start = unlisted = None
+            if urls is None:
+                start = self.discovery_start(url, limit)
+            else:
+                unlisted = self.unlisted(url, urls)
+            try:
+                state = await run_pipeline(
+                    url,
+                    max_depth=site["max_depth"],
+                    extract_depth=site["extract_depth"],
+                    urls=urls,
+                    limit=limit,
+                    start=start,
+                    unlisted=unlisted,
+                )
+            except Exception:
+                logger.exception("Recrawl failed", extra={"url": url})
+                summary["failed"] += 1
+                if urls is None:
+                    # Retry the full crawl after the shortest page interval.
+                    site["last_discovery"] = (
+                        now - self.discovery_interval + self.min_interval
+                    )
+                self.record(url, urls or [], {}, now)
+                continue
+
+            contents: Dict[str, List[str]] = defaultdict(list)
+            for doc in state["raw_docs"]:
+                contents[doc.metadata["source"]].append(doc.page_content)
+            fetched = {
+                source: await checksum("\n".join(parts))
+                for source, parts in contents.items()
+            }
+
+            if urls is None:
+                cut_short = limit is not None and len(fetched) >= limit
+                site["frontier"] = list(fetched)[-1] if cut_short else None
+            summary["full_crawls"] += urls is None
+            summary["pages"] += len(fetched)
+            summary["removed"] += len(state.get("removed", []))
+            summary["changed"] += self.record(
+                url,
+                urls,
+                fetched,
+                now,
+                complete=not state.get("partial"),
+                removed=state.get("removed", []),
+            )
+
+        self.save()
+        if any(summary.values()):
+            logger.info("Recrawl tick completed", extra=summary)
+        return summary
+
+    async def run(self, poll_seconds: float = RECRAWL_POLL_SECONDS) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Recrawl tick failed")
+            await asyncio.sleep(poll_seconds)
+
+    def status(self, now: Optional[float] = None) -> Dict:
+        now = self.clock() if now is None else now
+        sites = {}
+        for url, site in self.sites.items():
+            pages = site["pages"].values()
+            sites[url] = {
+                "pages": len(site["pages"]),
+                "due": sum(now - p["last_crawled"] >= p["interval"] for p in pages),
+                "changes": sum(p["changes"] for p in pages),
+                "checks": sum(p["checks"] for p in pages),
+                "mean_interval_hours": round(
+                    sum(p["interval"] for p in pages) / max(len(pages), 1) / HOUR, 2
+                ),
+                "next_full_crawl_hours": round(
+                    max(0.0, site["last_discovery"] + self.discovery_interval - now)
+                    / HOUR,
+                    2,
+                ),
+            }
+        return {"budget_remaining": self.allowance(now), "sites": sites}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Scheduled recrawls with adaptive per-page frequency",
+    )
+    parser.add_argument(
+        "--state",
+        default=RECRAWL_STATE,
+        help=f"Scheduler state file (default: {RECRAWL_STATE})",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="Register a site for scheduled recrawls")
+    add.add_argument("url")
+    add.add_argument("--max-depth", type=int, default=5)
+    add.add_argument(
+        "--extract-depth", default="advanced", choices=["basic", "advanced"]
+    )
+
+    remove = sub.add_parser("remove", help="Stop recrawling a site")
+    remove.add_argument("url")
+
+    run = sub.add_parser("run", help="Run the scheduler loop")
+    run.add_argument(
+        "--once", action="store_true", help="Run a single tick and exit"
+    )
+    run.add_argument("--poll-seconds", type=float, default=RECRAWL_POLL_SECONDS)
+
+    sub.add_parser("status", help="Show per-site schedule and change counts")
+    return parser.parse_args()
+
+
+async def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = parse_args()
+    scheduler = RecrawlScheduler(args.state)
+
+    if args.command == "add":
+        scheduler.add_site(
+            args.url, max_depth=args.max_depth, extract_depth=args.extract_depth
+        )
+        scheduler.save()
+    elif args.command == "remove":
+        scheduler.remove_site(args.url)
+        scheduler.save()
+    elif args.command == "status":
+        print(json.dumps(scheduler.status(), indent=2))
+    elif args.once:
+        print(json.dumps(await scheduler.tick()))
+    else:
+        await scheduler.run(args.poll_seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+import logging
+import os
+from typing import List, Optional, Protocol
+
+import numpy as np
+from langchain_core.documents import Document
+
+from fallback import tokenize
+
+logger = logging.getLogger(__name__)
+
+# retrieve over-fetches RETRIEVE_CANDIDATES chunks; the rerank node rescores
+# them and keeps the best RERANK_TOP_K that fit in CONTEXT_MAX_CHARS.
+RETRIEVE_CANDIDATES = int(os.getenv("RETRIEVE_CANDIDATES", "40"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "6"))
+CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", "4000"))
+
+# Maximal marginal relevance: 1.0 ranks by relevance alone, lower values
+# trade relevance for dissimilarity to the chunks already picked. At most
+# MAX_CHUNKS_PER_SOURCE chunks come from one page (0 disables the cap).
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MAX_CHUNKS_PER_SOURCE = int(os.getenv("MAX_CHUNKS_PER_SOURCE", "2"))
+
+# "lexical" (default), "cross-encoder" (needs sentence-transformers) or
+# "none" to keep the vector store's order.
+RERANK_SCORER = os.getenv("RERANK_SCORER", "lexical")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on "
+    "or the this to what when where which who why with you your".split()
+)
+
+
+class Scorer(Protocol):
+    # True when scoring is CPU heavy and should leave the event loop.
+    blocking: bool
+
+    def score(
+        self, query: str, docs: List[Document], vector_scores: np.ndarray
+    ) -> np.ndarray: ...
+
+
+def minmax(values: np.ndarray) -> np.ndarray:
+    span = values.max(axis=0) - values.min(axis=0)
+    return (values - values.min(axis=0)) / np.where(span == 0, 1, span)
+
+
+class LexicalScorer:
+    """Cheap CPU scorer blending the vector score with lexical features.
+
+    Features are computed for the whole candidate batch at once: BM25 over
+    the batch, query-term coverage, query bigram hits and query terms in the
+    source URL, each min-max normalised and linearly combined.
+    """
+
+    blocking = False
+
+    weights = np.asarray([0.45, 0.25, 0.15, 0.10, 0.05], dtype=np.float32)
+
+    def score(
+        self, query: str, docs: List[Document], vector_scores: np.ndarray
+    ) -> np.ndarray:
+        terms = list(dict.fromkeys(t for t in tokenize(query) if t not in STOPWORDS))
+        if not terms:
+            return vector_scores.astype(np.float32)
+
+        vocab = {t: j for j, t in enumerate(terms)}
+        tf = np.zeros((len(docs), len(terms)), dtype=np.float32)
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        texts = []
+        for i, doc in enumerate(docs):
+            tokens = tokenize(doc.page_content)
+            lengths[i] = len(tokens)
+            texts.append(" ".join(tokens))
+            for token in tokens:
+                j = vocab.get(token)
+                if j is not None:
+                    tf[i, j] += 1
+
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        norm = 1.2 * (0.25 + 0.75 * lengths / max(lengths.mean(), 1.0))
+        bm25 = (idf * tf * 2.2 / (tf + norm[:, None])).sum(axis=1)
+
+        coverage = (tf > 0).mean(axis=1)
+
+        bigrams = [f"{a} {b}" for a, b in zip(terms, terms[1:])]
+        phrase = np.asarray(
+            [sum(bg in text for bg in bigrams) for text in texts], dtype=np.float32
+        ) / max(len(bigrams), 1)
+
+        sources = [" ".join(tokenize(d.metadata.get("source", ""))) for d in docs]
+        in_source = np.asarray(
+            [sum(t in src for t in terms) for src in sources], dtype=np.float32
+        ) / len(terms)
+
+        features = np.column_stack(
+            [vector_scores, bm25, coverage, phrase, in_source]
+        ).astype(np.float32)
+        return minmax(features) @ self.weights
+
+
+class CrossEncoderScorer:
+    """Scores (query, chunk) pairs with a local cross-encoder model."""
+
+    blocking = True
+
+    def __init__(self, model_name: str = RERANK_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+
+    def score(
+        self, query: str, docs: List[Document], vector_scores: np.ndarray
+    ) -> np.ndarray:
+        pairs = [(query, d.page_content) for d in docs]
+        return np.asarray(self.model.predict(pairs, batch_size=len(pairs)))
+
+
+class VectorScorer:
+    """Keeps the vector store's ranking."""
+
+    blocking = False
+
+    def score(
+        self, query: str, docs: List[Document], vector_scores: np.ndarray
+    ) -> np.ndarray:
+        return vector_scores
+
+
+_scorer: Scorer | None = None
+
+
+def get_scorer() -> Scorer:
+    global _scorer
+    if _scorer is None:
+        if RERANK_SCORER == "cross-encoder":
+            try:
+                _scorer = CrossEncoderScorer()
+            except ImportError:
+                logger.warning(
+                    "sentence-transformers not installed, using lexical reranking"
+                )
+                _scorer = LexicalScorer()
+        elif RERANK_SCORER == "none":
+            _scorer = VectorScorer()
+        else:
+            _scorer = LexicalScorer()
+    return _scorer
+
+
+def select_within_budget(
+    docs: List[Document],
+    scores: np.ndarray,
+    vectors: Optional[np.ndarray] = None,
+    *,
+    top_k: int = RERANK_TOP_K,
+    max_chars: int = CONTEXT_MAX_CHARS,
+    lambda_mult: float = MMR_LAMBDA,
+    max_per_source: int = MAX_CHUNKS_PER_SOURCE,
+) -> List[Document]:
+    """Pick chunks by maximal marginal relevance within the context budget.
+
+    Each step takes the candidate maximising
+    `lambda * relevance - (1 - lambda) * max similarity to those picked`,
+    skipping chunks that would overflow `max_chars` or exceed the per-source
+    cap. Pairwise similarities come from one matrix product over the
+    candidate vectors; without vectors only relevance and the caps apply.
+    """
+    if not docs:
+        return []
+
+    relevance = minmax(np.asarray(scores, dtype=np.float32))
+    if vectors is not None and lambda_mult < 1.0:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        normed = vectors / np.maximum(norms, 1e-12)
+        similarity = normed @ normed.T
+    else:
+        similarity = None
+
+    closest = np.zeros(len(docs), dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    per_source: dict = {}
+    selected: List[Document] = []
+    total = 0
+
+    while len(selected) < top_k and available.any():
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * closest
+        i = int(np.argmax(np.where(available, mmr, -np.inf)))
+        available[i] = False
+
+        text = (docs[i].page_content or "").strip()
+        source = docs[i].metadata.get("source", "")
+        if not text or total + len(text) > max_chars:
+            continue
+        if max_per_source and per_source.get(source, 0) >= max_per_source:
+            continue
+
+        selected.append(docs[i])
+        total += len(text)
+        per_source[source] = per_source.get(source, 0) + 1
+        if similarity is not None:
+            np.maximum(closest, similarity[i], out=closest)
+
+    return selected
@@ -1,7 +1,10 @@
 import asyncio
+import json
+import secrets
 import time
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,12 +13,31 @@ from uuid import uuid4
 from urllib.parse import unquote
 from typing import Optional, List, Dict
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, HttpUrl
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from langchain_core.messages import BaseMessage, HumanMessage
+from pydantic import BaseModel, Field, HttpUrl
 from dotenv import load_dotenv
 
-from injestion import run_pipeline
-from query import query_app
+import executors
+import profiling
+import providers
+from query import get_query_app, persisted
+from coalesce import SingleFlight, normalize_query
+from admission import AdmissionController, Overloaded
+from deadline import new_deadline, remaining
+from namespaces import resolve_namespaces
+from fastjson import FastJSONResponse
+from batch import (
+    BATCH_CONCURRENCY,
+    BATCH_MAX_QUERIES,
+    FAQ_FILE,
+    embed_queries,
+    prewarm,
+    read_queries,
+    run_batch,
+)
 
 # write to stdio in development.
 logging.basicConfig(
@@ -31,7 +53,36 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="Palma Help Agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy work happens here rather than at import: compiling the query
+    # graph and building the chat-path clients. /ready reports the outcome.
+    start = time.perf_counter()
+    app.state.ready = False
+    app.state.startup_error = None
+    try:
+        await asyncio.to_thread(get_query_app)
+        await asyncio.to_thread(providers.warmup)
+        app.state.ready = True
+    except Exception as e:
+        logger.exception("Startup warmup failed")
+        app.state.startup_error = str(e)
+
+    app.state.startup_seconds = round(time.perf_counter() - start, 3)
+    logger.info(
+        "Startup completed",
+        extra={
+            "ready": app.state.ready,
+            "elapsed_seconds": app.state.startup_seconds,
+        },
+    )
+    yield
+    await providers.aclose()
+    executors.shutdown()
+
+
+app = FastAPI(title="Palma Help Agent", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -39,12 +90,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Responses smaller than this are sent uncompressed.
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+# Page size bounds for /ui/history.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+
+
+# Concurrent first-turn questions with the same wording and namespace share
+# one query_app run (see invoke_query).
+query_flights = SingleFlight()
+
+# Bounds concurrent query_app runs; configured via CHAT_MAX_CONCURRENCY,
+# CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT and CHAT_MAX_QUEUED_PER_SESSION.
+chat_admission = AdmissionController.from_env("CHAT")
+
+# Post-crawl cache warming runs in the background; keep the tasks referenced.
+background_tasks: set = set()
+
+# Shared secret for the /admin endpoints, sent as X-Admin-Token. Without it
+# they are disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Extra time allowed past a request's deadline for the graph to return the
+# partial or fallback answer its stages produced.
+DEADLINE_GRACE_SECONDS = 1.0
 
 
 class CrawlRequest(BaseModel):
     url: HttpUrl
     max_depth: Optional[int] = 5
     extract_depth: Optional[Literal["basic", "advanced"]] = "advanced"
+    # Build a fresh version and swap it in instead of updating in place.
+    rebuild: bool = False
 
 
 class CrawlResponse(BaseModel):
@@ -54,14 +134,96 @@ class CrawlResponse(BaseModel):
 
 class ChatRequest(BaseModel):
     query: str
-    namespace: str
+    # Any combination of one namespace, a list and a configured group
+    # (NAMESPACE_GROUPS); they are searched together.
+    namespace: Optional[str] = None
+    namespaces: Optional[List[str]] = None
+    namespace_group: Optional[str] = None
     session_id: Optional[str] = None
 
 
+class BatchRequest(BaseModel):
+    queries: List[str]
+    namespace: Optional[str] = None
+    namespaces: Optional[List[str]] = None
+    namespace_group: Optional[str] = None
+    concurrency: Optional[int] = Field(None, ge=1)
+    retrieve_only: bool = False
+
+
 class ChatResponse(BaseModel):
     session_id: str
     answer: str
     sources: List[Dict[str, str]]
+    degraded: Optional[str] = None
+
+
+async def invoke_query(query: str, namespaces: List[str], thread_id: str) -> dict:
+    query_app = get_query_app()
+    deadline = new_deadline()
+    config = {"configurable": {"thread_id": thread_id, "deadline": deadline}}
+    input_state = {
+        "query": query,
+        "namespace": ",".join(namespaces),
+        "namespaces": namespaces,
+        "deadline": deadline,
+    }
+
+    async def run() -> dict:
+        async with chat_admission.slot(thread_id):
+            # The graph stages enforce their own budgets; this is the hard
+            # ceiling for anything they do not cover.
+            async with asyncio.timeout(remaining(deadline) + DEADLINE_GRACE_SECONDS):
+                # One checkpoint per turn instead of one per node.
+                return await query_app.ainvoke(
+                    input_state, config=config, durability="exit"
+                )
+
+    # Follow-up turns depend on the thread's history and cannot be shared.
+    snapshot = await query_app.aget_state(config)
+    if snapshot.values:
+        return await run()
+
+    # Only the shared run takes an admission slot, coalesced callers are free.
+    result, shared = await query_flights.do(
+        (normalize_query(query), tuple(namespaces)),
+        run,
+    )
+
+    if shared:
+        # The run was checkpointed under the first caller's thread; record
+        # the same turn in this caller's thread so follow-ups have history.
+        await query_app.aupdate_state(config, persisted(result), as_node="generate")
+        logger.info("Query coalesced", extra={"thread_id": thread_id})
+
+    return result
+
+
+def message_dict(message: BaseMessage) -> dict:
+    return {"type": message.type, "content": message.content, "id": message.id}
+
+
+def last_turn(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """The messages from the latest question onwards."""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return messages
+
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy: {e.reason}",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
 
 @app.get("/health")
@@ -70,8 +232,52 @@ async def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(
+            status_code=503,
+            detail=getattr(app.state, "startup_error", None) or "Starting up",
+        )
+    return {"status": "ready", "startup_seconds": app.state.startup_seconds}
+
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    return {
+        "chat_admission": chat_admission.stats(),
+        "coalesced_in_flight": len(query_flights),
+        "coalesced_total": query_flights.joined,
+    }
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample this worker for `seconds`; returns folded stacks for a
+    flamegraph."""
+    if seconds <= 0 or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="Invalid duration or interval")
+
+    logger.info("Profile started", extra={"seconds": seconds})
+    try:
+        folded = await profiling.profile(seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded)
+
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+async def admin_slow_requests(
+    kind: Optional[Literal["chat", "crawl"]] = None, limit: int = 20
+):
+    return {
+        "threshold_seconds": profiling.SLOW_REQUEST_SECONDS,
+        "requests": profiling.slowest(kind, limit),
+    }
+
+
 @app.post("/crawl")
-async def crawl_and_index(req: CrawlRequest) -> dict:
+async def crawl_and_index(req: CrawlRequest) -> CrawlResponse:
     start = time.perf_counter()
     logger.info(
         "Crawl started",
@@ -79,18 +285,33 @@ async def crawl_and_index(req: CrawlRequest) -> dict:
             "url": str(req.url),
             "max_depth": req.max_depth,
             "extract_depth": req.extract_depth,
+            "rebuild": req.rebuild,
         },
     )
 
     try:
-        await run_pipeline(
-            str(req.url),
-            max_depth=req.max_depth or 5,
-            extract_depth=req.extract_depth or "advanced",
-        )
+        # Ingestion pulls in the crawler and text splitters; chat-only workers
+        # never load them.
+        from injestion import run_pipeline
+
+        async with profiling.trace("crawl", url=str(req.url), rebuild=req.rebuild):
+            await run_pipeline(
+                str(req.url),
+                max_depth=req.max_depth or 5,
+                extract_depth=req.extract_depth or "advanced",
+                rebuild=req.rebuild,
+            )
 
         logger.info("Crawl completed successfully", extra={"url": str(req.url)})
-        return CrawlResponse(ok=True, url=req.url)
+
+        if FAQ_FILE:
+            # Fill the query-embedding cache and retrieval fallback for the
+            # known questions against the fresh index.
+            task = asyncio.create_task(prewarm(read_queries(FAQ_FILE), [str(req.url)]))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+        return CrawlResponse(ok=True, url=str(req.url))
 
     except KeyError as e:
         logger.exception("Missing configuration during crawl")
@@ -111,41 +332,44 @@ async def crawl_and_index(req: CrawlRequest) -> dict:
         )
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    # Ensure required environment variables are present before proceeding
-    required_env = ["OPENAI_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX"]
-    missing = [k for k in required_env if not os.getenv(k)]
+def check_required_env() -> None:
+    missing = [k for k in providers.required_env() if not os.getenv(k)]
     if missing:
         logger.error("Missing environment configuration", extra={"missing": missing})
         raise HTTPException(
             status_code=500,
             detail=f"Missing environment configuration: {', '.join(missing)}",
         )
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    # Ensure required environment variables are present before proceeding
+    check_required_env()
     session_id = req.session_id or str(uuid4())
 
+    try:
+        namespaces = resolve_namespaces(
+            req.namespace, req.namespaces, req.namespace_group
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     logger.info(
         "Chat request received",
         extra={
             "session_id": session_id,
-            "namespace": req.namespace,
+            "namespaces": namespaces,
         },
     )
 
     try:
         start = time.perf_counter()
 
-        result = await query_app.ainvoke(
-            {
-                "query": req.query,
-                "namespace": req.namespace,
-                "messages": [],
-                "retrieved_docs": [],
-                "context": "",
-                "answer": "",
-            },
-            config={"configurable": {"thread_id": session_id}},
-        )
+        async with profiling.trace(
+            "chat", path="/chat", session_id=session_id, namespaces=namespaces
+        ):
+            result = await invoke_query(req.query, namespaces, session_id)
 
         elapsed = time.perf_counter() - start
 
@@ -154,22 +378,24 @@ async def chat(req: ChatRequest):
             extra={
                 "session_id": session_id,
                 "elapsed_seconds": round(elapsed, 3),
-                "sources_count": len(result.get("retrieved_docs", [])),
+                "sources_count": len(result["sources"]),
             },
         )
 
         return ChatResponse(
             session_id=session_id,
             answer=result["answer"],
-            sources=[
-                {
-                    "source": d.metadata.get("source", ""),
-                    "chunk_id": d.metadata.get("chunk_id", ""),
-                }
-                for d in result["retrieved_docs"]
-            ],
+            degraded=result.get("degraded") or None,
+            sources=result["sources"],
         )
 
+    except Overloaded as e:
+        raise overloaded_error(e)
+
+    except TimeoutError:
+        logger.error("Chat deadline exceeded", extra={"session_id": session_id})
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+
     except Exception as e:
         logger.exception(
             "Unhandled error during chat",
@@ -178,6 +404,47 @@ async def chat(req: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/batch", dependencies=[Depends(require_admin)])
+async def chat_batch(req: BatchRequest):
+    check_required_env()
+    try:
+        namespaces = resolve_namespaces(
+            req.namespace, req.namespaces, req.namespace_group
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(req.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BATCH_MAX_QUERIES} queries per batch",
+        )
+
+    logger.info(
+        "Batch request received",
+        extra={"queries": len(req.queries), "namespaces": namespaces},
+    )
+
+    # Embed up front so a failure is reported before the stream starts.
+    try:
+        embeddings = await embed_queries(req.queries)
+    except Exception as e:
+        logger.exception("Batch embedding failed")
+        raise HTTPException(status_code=502, detail=f"Embedding failed: {e}")
+
+    async def lines():
+        async for result in run_batch(
+            req.queries,
+            namespaces,
+            embeddings=embeddings,
+            generate_answers=not req.retrieve_only,
+            concurrency=min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY),
+        ):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.post("/ui/query")
 async def ui_query_proxy(request: Request):
     logger.info("UI query proxy request received")
@@ -188,46 +455,95 @@ async def ui_query_proxy(request: Request):
     configurable = body.get("configurable", {})
 
     query = input_state.get("query")
-    namespace = input_state.get("namespace")
-    thread_id = configurable.get("thread_id")
+    # Without a thread id each request is its own session, also for
+    # admission control's per-session queues.
+    thread_id = configurable.get("thread_id") or str(uuid4())
 
     if not query:
         logger.warning("UI query missing query field")
         raise HTTPException(status_code=400, detail="Missing query")
 
-    if not namespace:
-        logger.warning("UI query missing namespace field")
-        raise HTTPException(status_code=400, detail="Missing namespace")
+    try:
+        namespaces = resolve_namespaces(
+            input_state.get("namespace"),
+            input_state.get("namespaces"),
+            input_state.get("namespace_group"),
+        )
+    except ValueError as e:
+        logger.warning("UI query namespace rejected", extra={"error": str(e)})
+        raise HTTPException(status_code=400, detail=str(e))
 
     logger.info(
         "UI query forwarded to chat",
         extra={"thread_id": thread_id},
     )
 
-    result = await query_app.ainvoke(
-        {
-            "query": query,
-            "namespace": namespace,
-            "messages": [],
-            "retrieved_docs": [],
-            "context": "",
-            "answer": "",
-        },
-        config={"configurable": {"thread_id": thread_id}},
-    )
+    try:
+        async with profiling.trace(
+            "chat", path="/ui/query", session_id=thread_id, namespaces=namespaces
+        ):
+            result = await invoke_query(query, namespaces, thread_id)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except TimeoutError:
+        logger.error("UI query deadline exceeded", extra={"thread_id": thread_id})
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
 
     logger.info(
         "UI query completed",
         extra={"thread_id": thread_id},
     )
 
-    return {
-        "output": {
-            "query": query,
-            "messages": result["messages"],
-            "answer": result["answer"],
+    # Only the new turn by default; earlier turns are paged from /ui/history.
+    messages = result["messages"]
+    if not body.get("include_history"):
+        messages = last_turn(messages)
+
+    return FastJSONResponse(
+        {
+            "output": {
+                "query": query,
+                "thread_id": thread_id,
+                "messages": [message_dict(m) for m in messages],
+                "answer": result["answer"],
+                "sources": result["sources"],
+                "degraded": result.get("degraded") or None,
+                "history_length": len(result["messages"]),
+            }
         }
-    }
+    )
+
+
+@app.get("/ui/history/{thread_id}")
+async def ui_history(
+    thread_id: str, offset: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE
+):
+    """A page of a thread's messages, oldest first.
+
+    Without `offset` the most recent `limit` messages are returned.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    snapshot = await get_query_app().aget_state(
+        {"configurable": {"thread_id": thread_id}}
+    )
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail="Unknown thread")
+
+    messages = snapshot.values.get("messages", [])
+    total = len(messages)
+    if offset is None:
+        offset = max(0, total - limit)
+    offset = max(0, offset)
+
+    return FastJSONResponse(
+        {
+            "thread_id": thread_id,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "messages": [message_dict(m) for m in messages[offset : offset + limit]],
+        }
+    )
 
 
 if __name__ == "__main__":
@@ -1,154 +1,195 @@
 import asyncio
-import time
+import json
+import logging
 import os
-from fastapi import Request
-from typing import Literal, Optional, Dict
-from uuid import uuid4
-from urllib.parse import unquote
-from typing import Optional, List, Dict
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, HttpUrl
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from injestion import run_pipeline
-from query import query_app
+from order import OrderConflict, OrderNotFound, OrderService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
 
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="Palma Help Agent")
+# Comment lines sent on idle event streams so proxies keep them open.
+ORDER_KEEPALIVE_SECONDS = float(os.getenv("ORDER_KEEPALIVE_SECONDS", "15"))
+
+orders = OrderService()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await orders.open()
+    yield
+    await orders.close()
+
+
+app = FastAPI(title="Palma Help Agent", lifespan=lifespan)
 
 
 @app.get("/health")
 async def health() -> dict:
     return {"status": "ok"}
 
+
 # --- Order Workflow Endpoints ---
-# from order import order_app
-
-# class OrderRequest(BaseModel):
-#     item: str
-#     quantity: int
-
-
-# @app.post("/order/start")
-# async def start_order(req: OrderRequest):
-#     order_id = str(uuid4())
-
-#     # Start workflow asynchronously
-#     asyncio.create_task(
-#         order_app.ainvoke(
-#             {
-#                 "item": req.item,
-#                 "quantity": req.quantity,
-#                 "approved": None,
-#                 "status": "started",
-#             },
-#             config={"configurable": {"thread_id": order_id}},
-#         )
-#     )
-
-#     return {
-#         "order_id": order_id,
-#         "status": "started",
-#     }
-
-
-# import json
-# import asyncio
-# from fastapi.responses import StreamingResponse
-
-
-# @app.get("/order/events/{order_id}")
-# async def order_events(order_id: str):
-
-#     async def event_stream():
-#         try:
-#             async for event in order_app.astream_events(
-#                 None,
-#                 config={"configurable": {"thread_id": order_id}},
-#             ):
-#                 yield f"data: {json.dumps(event)}\n\n"
-
-#         except asyncio.CancelledError:
-#             return
-
-#     return StreamingResponse(
-#         event_stream(),
-#         media_type="text/event-stream",
-#         headers={
-#             "Cache-Control": "no-cache",
-#             "Connection": "keep-alive",
-#         },
-#     )
-
-
-# from typing import Literal
-
-
-# class DecisionRequest(BaseModel):
-#     order_id: str
-#     decision: Literal["approve", "reject"]
-
-
-# @app.post("/order/decision")
-# async def order_decision(req: DecisionRequest):
-#     await order_app.ainvoke(
-#         req.decision,
-#         config={"configurable": {"thread_id": req.order_id}},
-#     )
-#     return {"status": "decision_received"}
-
-
-# import json
-# import asyncio
-# from uuid import uuid4
-# from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-
-# app = FastAPI()
-
-# @app.websocket("/ws/order")
-# async def order_ws(ws: WebSocket):
-#     await ws.accept()
-#     order_id = str(uuid4())
-
-#     try:
-#         # 1. Receive initial order
-#         init = await ws.receive_json()
-
-#         asyncio.create_task(
-#             order_app.ainvoke(
-#                 {
-#                     "item": init["item"],
-#                     "quantity": init["quantity"],
-#                     "approved": None,
-#                     "status": "started",
-#                 },
-#                 config={"configurable": {"thread_id": order_id}},
-#             )
-#         )
-
-#         # 2. Stream graph events
-#         async for event in order_app.astream_events(
-#             None,
-#             config={"configurable": {"thread_id": order_id}},
-#         ):
-#             await ws.send_json(event)
-
-#             # 3. Interrupt handling
-#             if event["event"] == "on_interrupt":
-#                 decision_msg = await ws.receive_json()
-#                 await order_app.ainvoke(
-#                     decision_msg["decision"],  # approve | reject
-#                     config={"configurable": {"thread_id": order_id}},
-#                 )
-
-#             if event["event"] == "on_chain_end":
-#                 break
-
-#     except WebSocketDisconnect:
-#         print("Client disconnected")
+
+
+class OrderRequest(BaseModel):
+    item: str
+    quantity: int
+
+
+class DecisionRequest(BaseModel):
+    order_id: str
+    decision: Literal["approve", "reject"]
+
+
+def is_final(event: dict) -> bool:
+    return event["event"] in ("done", "error")
+
+
+@app.post("/order/start")
+async def start_order(req: OrderRequest):
+    order_id = await orders.start(req.item, req.quantity)
+    return {"order_id": order_id, "status": "started"}
+
+
+@app.get("/order/{order_id}")
+async def order_state(order_id: str):
+    try:
+        return await orders.state(order_id)
+    except OrderNotFound:
+        raise HTTPException(status_code=404, detail="Unknown order")
+
+
+@app.post("/order/decision")
+async def order_decision(req: DecisionRequest):
+    try:
+        await orders.decide(req.order_id, req.decision)
+    except OrderNotFound:
+        raise HTTPException(status_code=404, detail="Unknown order")
+    except OrderConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "decision_received"}
+
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    return {"orders": orders.stats()}
+
+
+@app.get("/order/events/{order_id}")
+async def order_events(order_id: str):
+    """Server-sent events for one order: a `snapshot` of its persisted state,
+    then `update`, `interrupt` and finally `done` or `error` as they happen.
+    Any number of clients can follow the same order."""
+    try:
+        await orders.state(order_id)
+    except OrderNotFound:
+        raise HTTPException(status_code=404, detail="Unknown order")
+
+    def sse(event: dict) -> str:
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    async def event_stream():
+        # Subscribe before reading the snapshot so no event falls between.
+        async with orders.events.subscribe(order_id) as queue:
+            state = await orders.state(order_id)
+            yield sse({"event": "snapshot", **state})
+            if state.get("done"):
+                return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), ORDER_KEEPALIVE_SECONDS)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Fell behind; the client reconnects for a fresh snapshot.
+                    return
+                yield sse(event)
+                if is_final(event):
+                    return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
+
+
+@app.websocket("/ws/order")
+async def order_ws(ws: WebSocket):
+    """Start an order ({"item", "quantity"}) or follow one ({"order_id"}),
+    answer its approval with {"decision": "approve" | "reject"}."""
+    await ws.accept()
+
+    try:
+        init = await ws.receive_json()
+        if "order_id" in init:
+            order_id = init["order_id"]
+        else:
+            order_id = await orders.start(init["item"], init["quantity"])
+
+        async with orders.events.subscribe(order_id) as queue:
+            try:
+                state = await orders.state(order_id)
+            except OrderNotFound:
+                await ws.send_json({"event": "error", "error": "Unknown order"})
+                await ws.close()
+                return
+
+            await ws.send_json({"event": "snapshot", **state})
+            if state.get("done"):
+                await ws.close()
+                return
+
+            # Waiting already when the client connected, or once an
+            # interrupt arrives: ask the client, then resume the order.
+            pending = None if state.get("running") else state.get("approval")
+            while True:
+                if pending is not None:
+                    await ws.send_json(
+                        {"event": "interrupt", "order_id": order_id, "value": pending}
+                    )
+                    decision = await ws.receive_json()
+                    pending = None
+                    try:
+                        await orders.decide(order_id, decision["decision"])
+                    except (OrderConflict, OrderNotFound) as e:
+                        await ws.send_json({"event": "error", "error": str(e)})
+
+                event = await queue.get()
+                if event is None:
+                    await ws.close(code=1013)
+                    return
+                if event["event"] == "interrupt":
+                    pending = event["value"]
+                    continue
+                await ws.send_json(event)
+                if is_final(event):
+                    break
+
+        await ws.close()
+
+    except WebSocketDisconnect:
+        logger.info("Order client disconnected")
+
 
 # Client-side example (e.g., in a browser console):
 
@@ -164,12 +205,12 @@ async def health() -> dict:
 # ws.onmessage = (e) => {
 #   const event = JSON.parse(e.data);
 
-#   if (event.event === "on_interrupt") {
+#   if (event.event === "interrupt") {
 #     // show approve / reject UI
 #     ws.send(JSON.stringify({ decision: "approve" }));
 #   }
 
-#   if (event.event === "on_chain_end") {
+#   if (event.event === "done") {
 #     ws.close();
 #   }
 # };
@@ -182,4 +223,4 @@ if __name__ == "__main__":
     host = os.getenv("UVICORN_HOST", "127.0.0.1")
     port = int(os.getenv("UVICORN_PORT", "8000"))
     reload = os.getenv("UVICORN_RELOAD", "0") == "1"
-    uvicorn.run("server:app", host=host, port=port, reload=reload)
+    uvicorn.run("server_websocket:app", host=host, port=port, reload=reload)
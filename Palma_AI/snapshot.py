@@ -0,0 +1,421 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import aliases
+import docstore
+import providers
+from localindex import IndexWriter, LocalIndexStore, MappedStrings, StringsWriter
+
+logger = logging.getLogger(__name__)
+
+# Portable dump of one namespace, for seeding a new environment without
+# re-crawling or re-embedding. Layout of a snapshot directory:
+#
+#   manifest.json               namespace, count, dimensions, dtype, shards,
+#                               metadata columns and a sha256 per file
+#   vectors-00000.npy ...       (rows, dimensions) float16 or float32 shards
+#   ids.bin, ids.offsets.npy    utf-8 strings, same format as localindex.py
+#   texts.bin, texts.offsets.npy
+#   meta-<n>.values.bin/.offsets.npy   distinct JSON values of column n
+#   meta-<n>.codes.npy                 int32 per row, -1 where absent
+#   docstore/                   the namespace's parent pages, a copy of its
+#                               live docstore.py version (when it has one)
+#
+# Metadata is stored per key and dictionary encoded: `source` repeats for
+# every chunk of a page and costs four bytes a row instead of a full URL.
+# Everything is opened with mmap on import.
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SHARD_ROWS = int(os.getenv("SNAPSHOT_SHARD_ROWS", "50000"))
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "200"))
+SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "8"))
+
+# Metadata key holding the chunk text in Pinecone (PineconeVectorStore default).
+PINECONE_TEXT_KEY = "text"
+
+# Pinecone fetches at most this many ids per call.
+FETCH_BATCH = 100
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+Batch = Tuple[List[str], List[str], List[Dict[str, Any]], np.ndarray]
+
+
+def local_batches(namespace: str, batch_size: int) -> Iterator[Batch]:
+    store = LocalIndexStore(providers.LOCAL_INDEX_DIR, namespace, None)
+    index = store.index
+    if index is None:
+        return
+    if not len(index):
+        # Still carries the width of the vectors.
+        yield [], [], [], np.asarray(index.vectors[0:0])
+    for start in range(0, len(index), batch_size):
+        rows = range(start, min(start + batch_size, len(index)))
+        yield (
+            [index.ids[r] for r in rows],
+            [index.texts[r] for r in rows],
+            [json.loads(index.metadata[r]) for r in rows],
+            np.asarray(index.vectors[rows.start : rows.stop]),
+        )
+
+
+def pinecone_batches(namespace: str, workers: int) -> Iterator[Batch]:
+    index = providers.get_pinecone_index()
+    ids: List[str] = []
+    for page in index.list(namespace=namespace):
+        ids.extend(page)
+
+    def fetch(chunk: List[str]) -> Batch:
+        fetched = index.fetch(ids=chunk, namespace=namespace).vectors
+        rows = [fetched[i] for i in chunk if i in fetched]
+        metadatas = [dict(r.metadata or {}) for r in rows]
+        texts = [m.pop(PINECONE_TEXT_KEY, "") for m in metadatas]
+        vectors = np.asarray([r.values for r in rows], dtype=np.float32)
+        return [r.id for r in rows], texts, metadatas, vectors
+
+    chunks = [ids[i : i + FETCH_BATCH] for i in range(0, len(ids), FETCH_BATCH)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map keeps the order, and the pool keeps `workers` fetches in flight.
+        yield from pool.map(fetch, chunks)
+
+
+def export_namespace(
+    namespace: str,
+    output: Path | str,
+    *,
+    dtype: str = "float16",
+    shard_rows: int = SNAPSHOT_SHARD_ROWS,
+    workers: int = SNAPSHOT_WORKERS,
+) -> Path:
+    """Dump `namespace` from the configured backend to `output`."""
+    start = time.perf_counter()
+    output = Path(output)
+    staging = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    # Read whichever version the namespace's alias points at.
+    physical = aliases.resolve(namespace)
+    if providers.VECTOR_BACKEND == "local":
+        batches = local_batches(physical, SNAPSHOT_BATCH_SIZE)
+    else:
+        batches = pinecone_batches(physical, workers)
+
+    ids = StringsWriter(staging, "ids")
+    texts = StringsWriter(staging, "texts")
+    columns: Dict[str, Dict[str, Any]] = {}
+    shards: List[Dict[str, Any]] = []
+    pending: List[np.ndarray] = []
+    pending_rows = 0
+    count = 0
+    dimensions = 0
+
+    def flush() -> None:
+        nonlocal pending, pending_rows
+        if not pending_rows:
+            return
+        name = f"vectors-{len(shards):05d}.npy"
+        np.save(staging / name, np.concatenate(pending).astype(dtype))
+        shards.append({"file": name, "rows": pending_rows})
+        pending, pending_rows = [], 0
+
+    for batch_ids, batch_texts, metadatas, vectors in batches:
+        for doc_id, text, meta in zip(batch_ids, batch_texts, metadatas):
+            ids.append(doc_id)
+            texts.append(text)
+            for key, value in meta.items():
+                column = columns.setdefault(
+                    key, {"codes": [-1] * count, "values": {}}
+                )
+                encoded = json.dumps(value)
+                column["codes"].append(
+                    column["values"].setdefault(encoded, len(column["values"]))
+                )
+            count += 1
+            for column in columns.values():
+                if len(column["codes"]) < count:
+                    column["codes"].append(-1)
+
+        if vectors.ndim == 2:
+            dimensions = vectors.shape[1]
+            while len(vectors):
+                take = shard_rows - pending_rows
+                pending.append(vectors[:take])
+                pending_rows += len(vectors[:take])
+                vectors = vectors[take:]
+                if pending_rows == shard_rows:
+                    flush()
+    flush()
+    ids.close()
+    texts.close()
+
+    column_names = []
+    for n, (key, column) in enumerate(columns.items()):
+        values = StringsWriter(staging, f"meta-{n}.values")
+        for encoded in column["values"]:
+            values.append(encoded)
+        values.close()
+        np.save(
+            staging / f"meta-{n}.codes.npy", np.asarray(column["codes"], dtype=np.int32)
+        )
+        column_names.append(key)
+
+    # Parent pages for small-to-big retrieval are kept on local disk for
+    # either backend.
+    pages = docstore.copy_pages(physical, staging / "docstore")
+
+    files = sorted(
+        p.relative_to(staging).as_posix() for p in staging.rglob("*") if p.is_file()
+    )
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "namespace": namespace,
+        "count": count,
+        "dimensions": int(dimensions),
+        "dtype": dtype,
+        "shards": shards,
+        "metadata_columns": column_names,
+        "docstore": pages,
+        "created": time.time(),
+        "sha256": {name: file_sha256(staging / name) for name in files},
+    }
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    if output.exists():
+        shutil.rmtree(output)
+    os.replace(staging, output)
+
+    logger.info(
+        "Snapshot exported",
+        extra={
+            "namespace": namespace,
+            "count": count,
+            "dtype": dtype,
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        },
+    )
+    return output
+
+
+class Snapshot:
+    """A snapshot directory opened read-only with mmap."""
+
+    def __init__(self, path: Path | str, verify: bool = True):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text())
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(
+                f"Unsupported snapshot format: {self.manifest.get('format')}"
+            )
+        if verify:
+            self.verify()
+
+        self.shards = [
+            np.load(self.path / shard["file"], mmap_mode="r")
+            for shard in self.manifest["shards"]
+        ]
+        self.shard_starts = np.cumsum([0] + [len(s) for s in self.shards])
+        self.ids = MappedStrings(self.path, "ids")
+        self.texts = MappedStrings(self.path, "texts")
+        self.columns = [
+            (
+                key,
+                MappedStrings(self.path, f"meta-{n}.values"),
+                np.load(self.path / f"meta-{n}.codes.npy", mmap_mode="r"),
+            )
+            for n, key in enumerate(self.manifest["metadata_columns"])
+        ]
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def verify(self) -> None:
+        for name, expected in self.manifest["sha256"].items():
+            if file_sha256(self.path / name) != expected:
+                raise ValueError(f"Snapshot file {name} failed its checksum")
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        meta = {}
+        for key, values, codes in self.columns:
+            code = int(codes[row])
+            if code >= 0:
+                meta[key] = json.loads(values[code])
+        return meta
+
+    def vectors(self, start: int, stop: int) -> np.ndarray:
+        """Rows [start, stop) as float32; views into the mapped shards where
+        a range stays within one shard."""
+        parts = []
+        shard = int(np.searchsorted(self.shard_starts, start, side="right")) - 1
+        while start < stop:
+            offset = start - self.shard_starts[shard]
+            end = min(stop, self.shard_starts[shard + 1])
+            parts.append(self.shards[shard][offset : offset + end - start])
+            start = end
+            shard += 1
+        vectors = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return vectors.astype(np.float32, copy=False)
+
+    def batches(self, size: int) -> Iterator[Tuple[int, int]]:
+        for start in range(0, len(self), size):
+            yield start, min(start + size, len(self))
+
+
+def import_snapshot(
+    path: Path | str,
+    namespace: Optional[str] = None,
+    *,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    workers: int = SNAPSHOT_WORKERS,
+    verify: bool = True,
+) -> int:
+    """Load a snapshot into the configured backend; returns rows written.
+
+    No embedding calls are made. Pinecone gets parallel batched upserts; the
+    local backend gets one new index version.
+    """
+    start = time.perf_counter()
+    snapshot = Snapshot(path, verify=verify)
+    namespace = namespace or snapshot.manifest["namespace"]
+    physical = aliases.resolve(namespace)
+
+    if providers.VECTOR_BACKEND == "local":
+        # Streamed slice by slice into the new version's mapped files.
+        store = LocalIndexStore(providers.LOCAL_INDEX_DIR, physical, None)
+        writer = IndexWriter(
+            store.directory,
+            physical,
+            len(snapshot),
+            snapshot.manifest["dimensions"],
+        )
+        for lo, hi in snapshot.batches(batch_size):
+            writer.append(
+                [snapshot.ids[r] for r in range(lo, hi)],
+                [snapshot.texts[r] for r in range(lo, hi)],
+                [snapshot.metadata(r) for r in range(lo, hi)],
+                snapshot.vectors(lo, hi),
+            )
+        writer.publish()
+        written = len(snapshot)
+    else:
+        index = providers.get_pinecone_index()
+        dimension = index.describe_index_stats().get("dimension")
+        if dimension and len(snapshot) and dimension != snapshot.manifest["dimensions"]:
+            raise ValueError(
+                f"Snapshot has {snapshot.manifest['dimensions']} dimensions, "
+                f"the index {dimension}"
+            )
+
+        def upsert(bounds: Tuple[int, int]) -> int:
+            lo, hi = bounds
+            vectors = snapshot.vectors(lo, hi)
+            records = []
+            for row, values in zip(range(lo, hi), vectors):
+                metadata = {
+                    k: v for k, v in snapshot.metadata(row).items() if v is not None
+                }
+                metadata[PINECONE_TEXT_KEY] = snapshot.texts[row]
+                records.append(
+                    {
+                        "id": snapshot.ids[row],
+                        "values": values.tolist(),
+                        "metadata": metadata,
+                    }
+                )
+            index.upsert(vectors=records, namespace=physical)
+            return len(records)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            written = sum(pool.map(upsert, snapshot.batches(batch_size)))
+
+    # Snapshots from before parent pages were included have none.
+    if snapshot.manifest.get("docstore"):
+        docstore.load_pages(physical, snapshot.path / "docstore")
+
+    logger.info(
+        "Snapshot imported",
+        extra={
+            "namespace": namespace,
+            "count": written,
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+        },
+    )
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export or import a namespace snapshot (vectors, texts, metadata)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Dump a namespace to a snapshot directory")
+    export.add_argument("namespace")
+    export.add_argument("output")
+    export.add_argument(
+        "--dtype",
+        default="float16",
+        choices=["float16", "float32"],
+        help="Vector precision (default: float16, half the size)",
+    )
+    export.add_argument("--shard-rows", type=int, default=SNAPSHOT_SHARD_ROWS)
+    export.add_argument("--workers", type=int, default=SNAPSHOT_WORKERS)
+
+    load = sub.add_parser("import", help="Load a snapshot into the configured store")
+    load.add_argument("snapshot")
+    load.add_argument(
+        "--namespace", help="Target namespace (default: the exported one)"
+    )
+    load.add_argument("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE)
+    load.add_argument("--workers", type=int, default=SNAPSHOT_WORKERS)
+    load.add_argument(
+        "--no-verify", action="store_true", help="Skip the sha256 checks"
+    )
+    return parser.parse_args()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = parse_args()
+
+    if args.command == "export":
+        path = export_namespace(
+            args.namespace,
+            args.output,
+            dtype=args.dtype,
+            shard_rows=args.shard_rows,
+            workers=args.workers,
+        )
+        print(f"Exported {args.namespace} to {path}")
+    else:
+        count = import_snapshot(
+            args.snapshot,
+            args.namespace,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            verify=not args.no_verify,
+        )
+        print(f"Imported {count} rows from {args.snapshot}")
+
+
+if __name__ == "__main__":
+    main()